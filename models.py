@@ -1,5 +1,7 @@
-import os
-from datetime import datetime
+import os, threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import List, Optional
 from dotenv import load_dotenv
 
@@ -15,6 +17,11 @@ from sqlmodel import (
     create_engine,
     select,
 )
+from sqlalchemy import Index, case, func, insert
+
+# Rows per INSERT round trip in bulk_insert
+DB_BATCH_SIZE = int(os.environ.get('DB_BATCH_SIZE', 1000))
+ROLLUP_PERIODS = ('hour', 'day', 'week')
 
 class Lockers(object):
     user: str
@@ -73,11 +80,15 @@ class Transactions(SQLModel, table=True):
 
 
 class Reports(SQLModel, table=True):
+    __table_args__ = (
+        # Previous report of a strategy, history of a vault
+        Index('ix_reports_chain_strategy_block', 'chain_id', 'strategy_address', 'block'),
+        Index('ix_reports_chain_vault_block', 'chain_id', 'vault_address', 'block'),
+    )
     id: int = Field(primary_key=True)
     chain_id: int
     # Transaction fields
     block: int
-    txn_hash: str
     txn_hash: str = Field(default=None, foreign_key="transactions.txn_hash")
     txn: Transactions = Relationship(back_populates="reports")
     # StrategyReported fields
@@ -124,17 +135,401 @@ class Reports(SQLModel, table=True):
     
 
 
-pguser = os.environ.get('PGUSER', 'postgres')
-pgpassword = os.environ.get('PGPASSWORD', 'yearn')
-pghost = os.environ.get('PGHOST', 'localhost')
-pgdatabase = os.environ.get('PGDATABASE', 'yearn')
-dsn = f'postgresql://{pguser}:{pgpassword}@{pghost}:5432/{pgdatabase}'
+class LatestReports(SQLModel, table=True):
+    """
+    The newest report of every strategy, kept current by insert_reports so
+    previous_report_id and APR inputs are a primary key lookup.
+    """
+    chain_id: int = Field(primary_key=True)
+    strategy_address: str = Field(primary_key=True)
+    report_id: int
+    vault_address: str
+    block: int
+    total_debt: int
+    total_gain: int
+    total_loss: int
+    date: datetime
+    timestamp: str
+
+
+class SnapshotRollup(SQLModel, table=True):
+    """
+    Snapshot assets aggregated per (period, bucket, product, name), kept
+    current by ingest_snapshots so charts and checks never scan Snapshot.
+    """
+    period: str = Field(primary_key=True)  # hour, day or week
+    bucket: datetime = Field(sa_column=Column(DateTime(timezone=True), primary_key=True))
+    product: str = Field(primary_key=True)
+    name: str = Field(primary_key=True)
+    count: int
+    sum_assets: float
+    min_assets: float
+    max_assets: float
+    first_assets: float
+    first_at: datetime = Field(sa_column=Column(DateTime(timezone=True)))
+    last_assets: float
+    last_at: datetime = Field(sa_column=Column(DateTime(timezone=True)))
+
+
+class Alerts(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    chain_id: int
+    handler: str
+    chat_id: str
+    message: str
+    created: datetime = Field(sa_column=Column(DateTime(timezone=True)))
+
+
+def database_url():
+    """
+    DATABASE_URL when set (e.g. sqlite:///alerts.db for local testing),
+    otherwise the Postgres DSN from the POSTGRES_* or PG* variables.
+    """
+    url = os.environ.get('DATABASE_URL')
+    if url:
+        return url
+    if os.environ.get('POSTGRES_HOST'):
+        user = os.environ.get('POSTGRES_USER')
+        password = os.environ.get('POSTGRES_PASS')
+        host = os.environ.get('POSTGRES_HOST')
+        return f'postgresql://{user}:{password}@{host}:5432/reports'
+    pguser = os.environ.get('PGUSER', 'postgres')
+    pgpassword = os.environ.get('PGPASSWORD', 'yearn')
+    pghost = os.environ.get('PGHOST', 'localhost')
+    pgdatabase = os.environ.get('PGDATABASE', 'yearn')
+    return f'postgresql://{pguser}:{pgpassword}@{pghost}:5432/{pgdatabase}'
+
+
+@lru_cache(maxsize=None)
+def get_engine():
+    """The engine is created on first use, importing models connects to nothing."""
+    url = database_url()
+    if url.startswith('sqlite'):
+        return create_engine(url, echo=False, connect_args={'check_same_thread': False})
+    return create_engine(url, echo=False)
+
+
+def __getattr__(name):
+    # Keeps `from models import engine` working without an import-time engine
+    if name == 'engine':
+        return get_engine()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def migrate(engine=None):
+    """
+    Creates missing tables and indexes, and fills LatestReports and
+    SnapshotRollup when they are new. Run once per deploy: python models.py
+    """
+    engine = engine or get_engine()
+    SQLModel.metadata.create_all(engine)
+    # create_all skips tables that exist, indexes added later need their own pass
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    with Session(engine) as session:
+        if session.exec(select(LatestReports).limit(1)).first() is None:
+            rebuild_latest_reports(engine)
+        if session.exec(select(SnapshotRollup).limit(1)).first() is None:
+            rebuild_snapshot_rollups(engine)
+
+
+def _rows(table, rows):
+    # Unset autoincrement keys are left out so the database assigns them
+    keys = {c.name for c in table.primary_key.columns}
+    for row in rows:
+        row = row.dict() if isinstance(row, SQLModel) else row
+        yield {k: v for k, v in row.items() if not (v is None and k in keys)}
+
+
+def _dialect_insert(bind):
+    if bind.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif bind.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        raise NotImplementedError(f'upserts are not supported on {bind.dialect.name}')
+    return dialect_insert
+
+
+def bulk_insert(model, rows, batch_size=DB_BATCH_SIZE, ignore_conflicts=False, engine=None):
+    """
+    Inserts rows (dicts or model instances) with one executemany per
+    batch_size rows inside a single transaction. ignore_conflicts skips
+    rows whose primary key already exists. Returns the number of rows sent.
+    """
+    engine = engine or get_engine()
+    table = model.__table__
+    if ignore_conflicts and engine.dialect.name in ('postgresql', 'sqlite'):
+        statement = _dialect_insert(engine)(table).on_conflict_do_nothing()
+    else:
+        statement = insert(table)
+    sent, batch = 0, []
+    with engine.begin() as conn:
+        for row in _rows(table, rows):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                conn.execute(statement, batch)
+                sent += len(batch)
+                batch = []
+        if batch:
+            conn.execute(statement, batch)
+            sent += len(batch)
+    return sent
+
+
+def insert_reports(reports, batch_size=DB_BATCH_SIZE, engine=None):
+    """
+    Bulk inserts Reports and moves LatestReports forward for every strategy
+    in the same transaction. Returns the new report ids in input order.
+    """
+    engine = engine or get_engine()
+    dialect_insert = _dialect_insert(engine)
+    table, latest = Reports.__table__, LatestReports.__table__
+    rows = list(_rows(table, reports))
+    statement = insert(table).returning(table.c.id, sort_by_parameter_order=True)
+    ids = []
+    with engine.begin() as conn:
+        for i in range(0, len(rows), batch_size):
+            ids += conn.execute(statement, rows[i:i + batch_size]).scalars().all()
+        newest = {}
+        for report_id, row in zip(ids, rows):
+            key = (row['chain_id'], row['strategy_address'])
+            if key not in newest or row['block'] >= newest[key]['block']:
+                newest[key] = {
+                    'report_id': report_id,
+                    **{c.name: row[c.name] for c in latest.columns if c.name != 'report_id'},
+                }
+        if newest:
+            upsert = dialect_insert(latest)
+            upsert = upsert.on_conflict_do_update(
+                index_elements=[latest.c.chain_id, latest.c.strategy_address],
+                set_={c.name: upsert.excluded[c.name] for c in latest.columns if not c.primary_key},
+                # Backfills of older reports never move the pointer back
+                where=latest.c.block <= upsert.excluded.block,
+            )
+            conn.execute(upsert, list(newest.values()))
+    return ids
+
+
+def rebuild_latest_reports(engine=None, batch_size=DB_BATCH_SIZE):
+    """Recomputes LatestReports from the full Reports history."""
+    engine = engine or get_engine()
+    columns = [c.name for c in LatestReports.__table__.columns if c.name != 'report_id']
+    newest = {}
+    with Session(engine) as session:
+        # Walks the (chain_id, strategy_address, block) index, last row of a key wins
+        reports = session.exec(
+            select(Reports).order_by(Reports.chain_id, Reports.strategy_address, Reports.block, Reports.id)
+            .execution_options(yield_per=batch_size)
+        )
+        for report in reports:
+            newest[(report.chain_id, report.strategy_address)] = {
+                'report_id': report.id, **{c: getattr(report, c) for c in columns},
+            }
+    with engine.begin() as conn:
+        conn.execute(LatestReports.__table__.delete())
+        rows = list(newest.values())
+        for i in range(0, len(rows), batch_size):
+            conn.execute(insert(LatestReports.__table__), rows[i:i + batch_size])
+    return len(newest)
+
+
+def latest_report(chain_id, strategy_address, engine=None):
+    with Session(engine or get_engine()) as session:
+        return session.get(LatestReports, (chain_id, strategy_address))
+
+
+def vault_reports(chain_id, vault_address, since_block=0, limit=100, engine=None):
+    """Newest first, served by the (chain_id, vault_address, block) index."""
+    with Session(engine or get_engine()) as session:
+        return session.exec(
+            select(Reports)
+            .where(Reports.chain_id == chain_id, Reports.vault_address == vault_address, Reports.block >= since_block)
+            .order_by(Reports.block.desc())
+            .limit(limit)
+        ).all()
+
+
+def _utc(timestamp):
+    # SQLite hands timezone-aware columns back naive, they are stored as UTC
+    if timestamp.tzinfo is None:
+        return timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone.utc)
+
+
+def bucket_start(timestamp, period):
+    timestamp = _utc(timestamp)
+    if period == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    day = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'day':
+        return day
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    raise ValueError(f'unknown period {period}')
+
+
+def rollup_points(points, periods=ROLLUP_PERIODS):
+    """
+    Aggregates (product, name, timestamp, assets) points into SnapshotRollup
+    rows, one per (period, bucket, product, name).
+    """
+    rollups = {}
+    for product, name, timestamp, assets in points:
+        timestamp = _utc(timestamp)
+        for period in periods:
+            key = (period, bucket_start(timestamp, period), product, name)
+            row = rollups.get(key)
+            if row is None:
+                rollups[key] = dict(
+                    zip(('period', 'bucket', 'product', 'name'), key),
+                    count=1, sum_assets=assets, min_assets=assets, max_assets=assets,
+                    first_assets=assets, first_at=timestamp, last_assets=assets, last_at=timestamp,
+                )
+                continue
+            row['count'] += 1
+            row['sum_assets'] += assets
+            row['min_assets'] = min(row['min_assets'], assets)
+            row['max_assets'] = max(row['max_assets'], assets)
+            if timestamp < row['first_at']:
+                row['first_assets'], row['first_at'] = assets, timestamp
+            if timestamp >= row['last_at']:
+                row['last_assets'], row['last_at'] = assets, timestamp
+    return list(rollups.values())
+
+
+def merge_rollups(rows, batch_size=DB_BATCH_SIZE, conn=None, engine=None):
+    """Upserts rollup rows, combining them with the stored aggregates."""
+    if conn is None:
+        with (engine or get_engine()).begin() as conn:
+            return merge_rollups(rows, batch_size, conn)
+    table = SnapshotRollup.__table__
+    least, greatest = (func.min, func.max) if conn.dialect.name == 'sqlite' else (func.least, func.greatest)
+    upsert = _dialect_insert(conn)(table)
+    new, old = upsert.excluded, table.c
+    upsert = upsert.on_conflict_do_update(
+        index_elements=[old.period, old.bucket, old.product, old.name],
+        set_={
+            'count': old.count + new.count,
+            'sum_assets': old.sum_assets + new.sum_assets,
+            'min_assets': least(old.min_assets, new.min_assets),
+            'max_assets': greatest(old.max_assets, new.max_assets),
+            'first_assets': case((new.first_at < old.first_at, new.first_assets), else_=old.first_assets),
+            'first_at': case((new.first_at < old.first_at, new.first_at), else_=old.first_at),
+            'last_assets': case((new.last_at >= old.last_at, new.last_assets), else_=old.last_assets),
+            'last_at': case((new.last_at >= old.last_at, new.last_at), else_=old.last_at),
+        },
+    )
+    for i in range(0, len(rows), batch_size):
+        conn.execute(upsert, rows[i:i + batch_size])
+    return len(rows)
+
+
+def ingest_snapshots(blocks, snapshots, batch_size=DB_BATCH_SIZE, engine=None):
+    """
+    Bulk inserts Block and Snapshot rows (dicts or models, snapshots refer
+    to blocks by block_id) and folds the snapshots into SnapshotRollup, all
+    in one transaction. Blocks that already exist are skipped.
+    """
+    engine = engine or get_engine()
+    blocks = list(_rows(Block.__table__, blocks))
+    snapshots = list(_rows(Snapshot.__table__, snapshots))
+    timestamps = {b['id']: b['timestamp'] for b in blocks}
+    with engine.begin() as conn:
+        known = {s['block_id'] for s in snapshots} - timestamps.keys()
+        if known:
+            timestamps.update(conn.execute(
+                select(Block.id, Block.timestamp).where(Block.id.in_(known))
+            ).all())
+        block_insert = _dialect_insert(conn)(Block.__table__).on_conflict_do_nothing()
+        for i in range(0, len(blocks), batch_size):
+            conn.execute(block_insert, blocks[i:i + batch_size])
+        for i in range(0, len(snapshots), batch_size):
+            conn.execute(insert(Snapshot.__table__), snapshots[i:i + batch_size])
+        points = ((s['product'], s['name'], timestamps[s['block_id']], s['assets']) for s in snapshots)
+        merge_rollups(rollup_points(points), batch_size, conn)
+    return len(snapshots)
+
+
+def rebuild_snapshot_rollups(engine=None, batch_size=DB_BATCH_SIZE):
+    """Recomputes SnapshotRollup from the raw Snapshot and Block tables."""
+    engine = engine or get_engine()
+    query = (
+        select(Snapshot.product, Snapshot.name, Block.timestamp, Snapshot.assets)
+        .join(Block, Snapshot.block_id == Block.id)
+        .execution_options(yield_per=batch_size)
+    )
+    with engine.begin() as conn:
+        conn.execute(SnapshotRollup.__table__.delete())
+        rows = rollup_points(conn.execute(query))
+        merge_rollups(rows, batch_size, conn)
+    return len(rows)
+
+
+def snapshot_series(product, name, period='day', start=None, end=None, engine=None):
+    """Rollups of one series in bucket order, for charts."""
+    query = select(SnapshotRollup).where(
+        SnapshotRollup.period == period,
+        SnapshotRollup.product == product,
+        SnapshotRollup.name == name,
+    )
+    if start is not None:
+        query = query.where(SnapshotRollup.bucket >= bucket_start(start, period))
+    if end is not None:
+        query = query.where(SnapshotRollup.bucket < end)
+    with Session(engine or get_engine()) as session:
+        return session.exec(query.order_by(SnapshotRollup.bucket)).all()
+
+
+def snapshot_changes(period, bucket, min_change, product=None, engine=None):
+    """
+    [(rollup, change)] for the series whose assets moved by at least
+    min_change (a fraction, 0.1 = 10%) between the first and last snapshot
+    of the bucket starting at `bucket`, for threshold checks.
+    """
+    change = (SnapshotRollup.last_assets - SnapshotRollup.first_assets) / SnapshotRollup.first_assets
+    query = select(SnapshotRollup, change).where(
+        SnapshotRollup.period == period,
+        SnapshotRollup.bucket == bucket_start(bucket, period),
+        SnapshotRollup.first_assets != 0,
+        func.abs(change) >= min_change,
+    )
+    if product is not None:
+        query = query.where(SnapshotRollup.product == product)
+    with Session(engine or get_engine()) as session:
+        return session.exec(query.order_by(func.abs(change).desc())).all()
+
+
+class AlertRecorder:
+    """
+    Buffers emitted alerts in memory, they are written with bulk_insert on
+    flush() so recording never adds a database round trip per alert.
+    """
+    def __init__(self, chain_id=1, batch_size=DB_BATCH_SIZE):
+        self.chain_id = chain_id
+        self.batch_size = batch_size
+        self.pending = []
+        self.lock = threading.Lock()
+
+    def add(self, handler, chat_id, message):
+        with self.lock:
+            self.pending.append({
+                'chain_id': self.chain_id,
+                'handler': handler,
+                'chat_id': str(chat_id),
+                'message': message,
+                'created': datetime.now(timezone.utc),
+            })
+
+    def flush(self):
+        with self.lock:
+            rows, self.pending = self.pending, []
+        if rows:
+            bulk_insert(Alerts, rows, self.batch_size)
+        return len(rows)
 
-user = os.environ.get('POSTGRES_USER')
-password = os.environ.get('POSTGRES_PASS')
-host = os.environ.get('POSTGRES_HOST')
-dsn = f'postgresql://{user}:{password}@{host}:5432/reports'
-engine = create_engine(dsn, echo=False)
 
-# SQLModel.metadata.drop_all(engine)
-SQLModel.metadata.create_all(engine)
+if __name__ == '__main__':
+    migrate()
+    print(f'Migrated {get_engine().url!r}')
@@ -0,0 +1,110 @@
+import os, threading
+from typing import NamedTuple
+from ape import networks
+from _cache import LRUCache, connect
+from _rpc import batch_request
+from _tracing import span
+
+BLOCK_CACHE_SIZE = int(os.environ.get('BLOCK_CACHE_SIZE', 4096))
+# Headers this close to the head can still be reorged, keep them in memory only
+REORG_DEPTH = 64
+
+
+class Header(NamedTuple):
+    number: int
+    timestamp: int
+    hash: str
+
+
+def parse_header(block):
+    return Header(int(block['number'], 16), int(block['timestamp'], 16), block['hash'])
+
+
+class BlockCache:
+    """
+    Block headers by number: an in-memory LRU in front of a SQLite store,
+    filled with batched eth_getBlockByNumber calls.
+    """
+    def __init__(self, maxsize=BLOCK_CACHE_SIZE):
+        self.memory = LRUCache(maxsize)
+        self._db = None
+        self._chain_id = None
+        self._head = None
+        self.lock = threading.RLock()
+
+    @property
+    def chain_id(self):
+        if self._chain_id is None:
+            self._chain_id = networks.provider.chain_id
+        return self._chain_id
+
+    @property
+    def db(self):
+        with self.lock:
+            if self._db is None:
+                self._db = connect()
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS blocks ('
+                    'chain_id INTEGER, number INTEGER, timestamp INTEGER, hash TEXT, '
+                    'PRIMARY KEY (chain_id, number))'
+                )
+            return self._db
+
+    def snapshot_head(self):
+        self._head = parse_header(batch_request([('eth_getBlockByNumber', ['latest', False])])[0])
+        self.memory.set(self._head.number, self._head)
+        return self._head
+
+    @property
+    def head(self):
+        if self._head is None:
+            self.snapshot_head()
+        return self._head
+
+    def _load(self, numbers):
+        found = {}
+        numbers = list(numbers)
+        with self.lock:
+            for i in range(0, len(numbers), 500):
+                chunk = numbers[i:i + 500]
+                rows = self.db.execute(
+                    f'SELECT number, timestamp, hash FROM blocks WHERE chain_id = ? '
+                    f'AND number IN ({",".join("?" * len(chunk))})',
+                    [self.chain_id, *chunk],
+                )
+                for row in rows:
+                    found[row[0]] = Header(*row)
+        return found
+
+    def _store(self, headers):
+        final = [h for h in headers if h.number <= self.head.number - REORG_DEPTH]
+        if not final:
+            return
+        with self.lock:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?)',
+                [(self.chain_id, *h) for h in final],
+            )
+            self.db.commit()
+
+    @span('enrich')
+    def prefetch(self, numbers):
+        missing = {n for n in numbers if n not in self.memory}
+        if not missing:
+            return
+        stored = self._load(sorted(missing))
+        missing -= stored.keys()
+        fetched = []
+        if missing:
+            calls = [('eth_getBlockByNumber', [hex(n), False]) for n in sorted(missing)]
+            fetched = [parse_header(b) for b in batch_request(calls)]
+            self._store(fetched)
+        for header in [*stored.values(), *fetched]:
+            self.memory.set(header.number, header)
+
+    def __getitem__(self, number):
+        header = self.memory.get(number)
+        if header is None:
+            self.prefetch([number])
+            header = self.memory.get(number)
+        return header
@@ -0,0 +1,37 @@
+import os, sqlite3, threading
+from collections import OrderedDict
+
+CACHE_DIR = os.environ.get('ALERTS_CACHE_DIR', '.alerts_cache')
+
+
+def connect(name='cache.sqlite'):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Shared by handler threads, callers serialize access with their own lock
+    return sqlite3.connect(os.path.join(CACHE_DIR, name), check_same_thread=False)
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.data:
+                return default
+            self.data.move_to_end(key)
+            return self.data[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
@@ -0,0 +1,36 @@
+from functools import lru_cache
+from ape import project
+from ape.contracts import ContractInstance
+from _networks import current
+
+# address book: {name: (contract type in contracts/, address)}
+ADDRESS_BOOKS = {}
+ADDRESS_BOOKS['ethereum'] = {
+    'veyfi': ('VeYFI', '0x90c1f9220d90d3966FbeE24045EDd73E1d588aD5'),
+    'ycrv_pool': ('CurveYcrvPool', '0x99f5aCc8EC2Da2BC0771c32814EFF52b712de1E5'),
+    'three_pool': ('Curve3Pool', '0xbEbc44782C7dB0a1A60Cb6fe97d0b483032FF1C7'),
+    'fee_distributor': ('FeeDistributor', '0xA464e6DCda8AC41e03616F95f4BC98a13b8922Dc'),
+    'vecrv': ('VeCRV', '0x5f3b5DfEb7B28CDbD7FAba78963EE202a494e2A2'),
+    'ybribe': ('YBribe', '0x03dFdBcD4056E2F92251c7B07423E1a33a7D3F6d'),
+    'ycrv': ('YCRV', '0xFCc5c47bE19d06BF83eB04298b026F81069ff65b'),
+    'usdt': ('USDT', '0xdAC17F958D2ee523a2206206994597C13D831ec7'),
+    'three_crv': ('ERC20', '0x6c3F90f043a72FA612cbac8115EE7e52BDe6E490'),
+    'settlement': ('GPv2Settlement', '0x9008D19f58AAbD9eD0D60971565AA8510560ab41'),
+    'oracle': ('ORACLE', '0x83d95e0D5f402511dB06817Aff3f9eA88224B030'),
+}
+# Contracts of the network this process alerts for
+CONTRACTS = ADDRESS_BOOKS[current().address_book]
+
+
+def has_contract(name):
+    return name in CONTRACTS
+
+
+@lru_cache(maxsize=None)
+def contract(name):
+    """
+    Contract instances built from the vendored ABIs in contracts/, created
+    on first use and shared by every handler. No explorer or code lookup.
+    """
+    contract_type, address = CONTRACTS[name]
+    return ContractInstance(address, getattr(project, contract_type).contract_type)
@@ -0,0 +1,64 @@
+import json, os, tempfile, threading
+
+CURSORS_PATH = os.environ.get('CURSORS_PATH', 'local_data.json')
+
+
+def atomic_write_json(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(data, fp, indent=2)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+class Cursors:
+    """
+    Next block to process for each handler, stored in local_data.json next to
+    the legacy last_block (kept as the lowest cursor). Every advance is
+    written with write-temp-then-rename, so a crash never leaves a partial
+    file and a handler only ever repeats its current chunk.
+    """
+    def __init__(self, path=CURSORS_PATH, default=None):
+        self.path = path
+        try:
+            with open(path, 'r') as fp:
+                self.data = json.load(fp)
+        except FileNotFoundError:
+            self.data = {}
+        self.cursors = self.data.setdefault('cursors', {})
+        self.default = self.data.get('last_block') or default
+        self.names = None
+        self.lock = threading.Lock()
+
+    def __getitem__(self, name):
+        return self.cursors.get(name, self.default)
+
+    def register(self, names):
+        """
+        Seeds a cursor at the default for every handler that has none yet.
+        last_block is the lowest registered cursor, so it never moves past
+        a handler that failed before its first chunk.
+        """
+        with self.lock:
+            self.names = list(names)
+            if self.default is not None:
+                for name in self.names:
+                    self.cursors.setdefault(name, self.default)
+
+    def advance(self, name, block):
+        with self.lock:
+            if block <= (self[name] or 0):
+                return
+            self.cursors[name] = block
+            names = self.names or self.cursors
+            self.data['last_block'] = min(self.cursors.get(n, self.default) for n in names)
+            atomic_write_json(self.path, self.data)
+
+    def start(self, names, default=None):
+        return min((self[name] for name in names), default=default)
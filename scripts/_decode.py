@@ -0,0 +1,149 @@
+from functools import lru_cache
+import eth_abi
+from eth_utils import encode_hex, keccak, to_checksum_address
+from hexbytes import HexBytes
+
+try:
+    from eth_abi.decoding import ContextFramesBytesIO, TupleDecoder
+    from eth_abi.registry import registry
+except ImportError:  # layout differs between eth_abi releases
+    registry = None
+
+
+@lru_cache(maxsize=65536)
+def checksum(address):
+    return to_checksum_address(address)
+
+
+def _converter(abi_type):
+    # eth_abi hands back lowercase addresses, ape users expect checksums
+    if abi_type == 'address':
+        return checksum
+    if abi_type.startswith('address['):
+        return lambda values: tuple(checksum(a) for a in values)
+    return None
+
+
+def _tuple_decoder(types):
+    """Decoder for `types` built once, instead of per call like eth_abi.decode."""
+    if registry is not None:
+        try:
+            decoder = TupleDecoder(decoders=tuple(registry.get_decoder(t) for t in types))
+            return lambda data: decoder(ContextFramesBytesIO(bytes(data)))
+        except Exception:
+            pass
+    return lambda data: eth_abi.decode(types, bytes(data))
+
+
+def _is_dynamic(abi_type):
+    return abi_type in ('string', 'bytes') or abi_type.endswith('[]') or abi_type.startswith('(')
+
+
+class EventDecoder:
+    """
+    Everything needed to decode one event, prepared once: its topic, the
+    argument names in ABI order and tuple decoders for the topics and data.
+    Dynamic indexed arguments are only stored as their hash in the topic
+    and come back as raw bytes.
+    """
+    __slots__ = ('name', 'topic', 'names', 'indexed', 'topic_decoder', 'data_decoder', 'converters')
+
+    def __init__(self, abi):
+        inputs = list(abi.inputs)
+        self.name = abi.name
+        self.topic = encode_hex(keccak(text=abi.selector))
+        self.names = tuple(i.name for i in inputs)
+        self.indexed = tuple(bool(i.indexed) for i in inputs)
+        topic_types = [i.canonical_type for i in inputs if i.indexed]
+        data_types = [i.canonical_type for i in inputs if not i.indexed]
+        self.topic_decoder = [
+            None if _is_dynamic(t) else _tuple_decoder([t]) for t in topic_types
+        ]
+        self.data_decoder = _tuple_decoder(data_types)
+        self.converters = tuple(_converter(i.canonical_type) for i in inputs)
+
+    def decode(self, topics, data):
+        data_values = iter(self.data_decoder(HexBytes(data)) if not all(self.indexed) else ())
+        topic_values = iter(
+            HexBytes(topic) if decoder is None else decoder(HexBytes(topic))[0]
+            for decoder, topic in zip(self.topic_decoder, topics[1:])
+        )
+        args = {}
+        for name, indexed, convert in zip(self.names, self.indexed, self.converters):
+            value = next(topic_values) if indexed else next(data_values)
+            args[name] = convert(value) if convert else value
+        return args
+
+
+_decoders = {}
+
+
+def event_decoder(event):
+    """The EventDecoder of an ape ContractEvent, shared by every caller."""
+    abi = event.abi
+    key = (abi.selector, tuple((i.name, bool(i.indexed)) for i in abi.inputs))
+    decoder = _decoders.get(key)
+    if decoder is None:
+        decoder = _decoders[key] = EventDecoder(abi)
+    return decoder
+
+
+class LogRecord:
+    """
+    A decoded log holding only what the handlers read. event_arguments is
+    decoded on first access, so logs a handler filters out by block or
+    skips never pay for ABI decoding.
+    """
+    __slots__ = (
+        'contract_address', 'event_name', 'block_number', 'transaction_hash', 'log_index',
+        'topics', 'data', 'decoder', '_args',
+    )
+
+    def __init__(self, contract_address, decoder, block_number, transaction_hash, log_index, topics, data):
+        self.contract_address = contract_address
+        self.event_name = decoder.name
+        self.block_number = block_number
+        self.transaction_hash = transaction_hash
+        self.log_index = log_index
+        self.topics = topics
+        self.data = data
+        self.decoder = decoder
+        self._args = None
+
+    @property
+    def event_arguments(self):
+        if self._args is None:
+            self._args = self.decoder.decode(self.topics, self.data)
+        return self._args
+
+    def __repr__(self):
+        return f'<{self.event_name} {self.contract_address} block={self.block_number} index={self.log_index}>'
+
+
+def _int(value):
+    return int(value, 16) if isinstance(value, str) else value
+
+
+def decode_logs(raw_logs, events):
+    """
+    Turns raw eth_getLogs results into LogRecords for `events`. Logs are
+    matched on (address, topic0), anything else is dropped.
+    """
+    decoders = {}
+    for event in events:
+        decoder = event_decoder(event)
+        decoders[(event.contract.address, decoder.topic)] = decoder
+    records = []
+    for log in raw_logs:
+        topics = log['topics']
+        if not topics:
+            continue
+        address = checksum(log['address'])
+        decoder = decoders.get((address, encode_hex(HexBytes(topics[0]))))
+        if decoder is None:
+            continue
+        records.append(LogRecord(
+            address, decoder, _int(log['blockNumber']), encode_hex(HexBytes(log['transactionHash'])),
+            _int(log['logIndex']), topics, log['data'],
+        ))
+    return records
@@ -0,0 +1,139 @@
+import os, threading
+from datetime import datetime, timezone
+import numpy as np
+from _cache import connect
+
+# Chain time covered by one summary, a day by default
+DIGEST_PERIOD = int(os.environ.get('DIGEST_PERIOD', 86_400))
+# kind: (title, +1 label, -1 label, unit)
+DIGEST_KINDS = {
+    'swap': ('Swaps', 'CRV → yCRV', 'yCRV → CRV', 'yCRV'),
+    'lp': ('Liquidity', 'added', 'removed', 'CRV+yCRV'),
+    'mint': ('yveCRV migrations', 'migrated', '', 'yCRV'),
+    'lock': ('CRV locks', 'locked', '', 'yCRV'),
+}
+
+
+def period_start(timestamp, period=DIGEST_PERIOD):
+    return timestamp - timestamp % period
+
+
+def summarize(kinds, directions, amounts, users):
+    """
+    Aggregates one period of events given as columns. Returns
+    {kind: {'net': float, direction: {count, volume, largest, users}}}.
+    """
+    summary = {}
+    for kind in np.unique(kinds):
+        in_kind = kinds == kind
+        stats = {'net': float(np.dot(directions[in_kind], amounts[in_kind]))}
+        for direction in (1, -1):
+            mask = in_kind & (directions == direction)
+            count = int(mask.sum())
+            if not count:
+                continue
+            stats[direction] = {
+                'count': count,
+                'volume': float(amounts[mask].sum()),
+                'largest': float(amounts[mask].max()),
+                'users': len(np.unique(users[mask])),
+            }
+        summary[str(kind)] = stats
+    return summary
+
+
+def render(period, summary, period_length=DIGEST_PERIOD):
+    start = datetime.fromtimestamp(period, timezone.utc).strftime('%m/%d/%Y %H:%M')
+    hours = period_length // 3600
+    msg = f'🗞 *yCRV activity digest*\n{start} UTC, {hours}h'
+    for kind, stats in summary.items():
+        title, up, down, unit = DIGEST_KINDS[kind]
+        msg += f'\n\n*{title}*'
+        for direction, label in ((1, up), (-1, down)):
+            if direction not in stats:
+                continue
+            s = stats[direction]
+            msg += (
+                f'\n{label}: {s["count"]:,} txns, {s["volume"]:,.0f} {unit} '
+                f'(largest {s["largest"]:,.0f}, {s["users"]:,} users)'
+            )
+        if down:
+            msg += f'\nNet flow: {stats["net"]:+,.0f} {unit}'
+    return msg
+
+
+class Digest:
+    """
+    Events a handler decoded, alerted on or not, stored per period in
+    SQLite. Once chain time passes the end of a period its rows are read
+    back as columns, aggregated in one vectorized pass and posted as one
+    summary per chat.
+    """
+    def __init__(self, period=DIGEST_PERIOD):
+        self.period = period
+        self._db = None
+        self.lock = threading.Lock()
+
+    @property
+    def db(self):
+        with self.lock:
+            if self._db is None:
+                self._db = connect('digest.sqlite')
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS digest ('
+                    'period INTEGER, chat_id TEXT, kind TEXT, direction INTEGER, amount REAL, '
+                    'user TEXT, txn_hash TEXT, log_index INTEGER, '
+                    # A chunk processed twice after a crash must not count twice
+                    'PRIMARY KEY (txn_hash, log_index, kind))'
+                )
+                # Periods already sent, rows replayed into them are dropped
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS posted (period INTEGER, chat_id TEXT, PRIMARY KEY (period, chat_id))'
+                )
+            return self._db
+
+    def add(self, rows):
+        """rows: [(timestamp, chat_id, kind, direction, amount, user, txn_hash, log_index)]"""
+        if not rows:
+            return
+        db = self.db
+        with self.lock:
+            posted = set(db.execute('SELECT period, chat_id FROM posted').fetchall())
+            rows = [(period_start(ts, self.period), str(chat), *rest) for ts, chat, *rest in rows]
+            db.executemany(
+                'INSERT OR IGNORE INTO digest VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [row for row in rows if (row[0], row[1]) not in posted],
+            )
+            db.commit()
+
+    def due(self, now):
+        db = self.db
+        with self.lock:
+            rows = db.execute(
+                'SELECT DISTINCT period, chat_id FROM digest WHERE period + ? <= ? ORDER BY period',
+                [self.period, now],
+            ).fetchall()
+        return rows
+
+    def columns(self, period, chat_id):
+        db = self.db
+        with self.lock:
+            rows = db.execute(
+                'SELECT kind, direction, amount, user FROM digest WHERE period = ? AND chat_id = ?',
+                [period, chat_id],
+            ).fetchall()
+        kinds, directions, amounts, users = zip(*rows)
+        return np.array(kinds), np.array(directions), np.array(amounts, dtype=float), np.array(users)
+
+    def close(self, now, send):
+        """
+        Posts every period that ended before chain time `now`, which must
+        only be passed once every digest handler has processed up to it.
+        """
+        for period, chat_id in self.due(now):
+            send(chat_id, render(period, summarize(*self.columns(period, chat_id)), self.period))
+            db = self.db
+            with self.lock:
+                db.execute('INSERT OR IGNORE INTO posted VALUES (?, ?)', [period, chat_id])
+                db.execute('DELETE FROM digest WHERE period = ? AND chat_id = ?', [period, chat_id])
+                db.commit()
@@ -0,0 +1,177 @@
+import os, time
+from collections import defaultdict
+from eth_utils import keccak, encode_hex
+from ape import networks
+from _tracing import span
+from _decode import decode_logs
+
+LOG_CHUNK_SIZE = int(os.environ.get('LOG_CHUNK_SIZE', 5_000))
+LOG_CHUNK_MAX = int(os.environ.get('LOG_CHUNK_MAX', 100_000))
+# Chunks are resized to keep each eth_getLogs around this many results
+LOG_TARGET_RESULTS = int(os.environ.get('LOG_TARGET_RESULTS', 2_000))
+# Provider answers to a query that is too large, the chunk is halved on these
+TOO_MANY_RESULTS = (
+    'query returned more than', 'block range', 'response size', 'too many results', '-32005',
+)
+# Infura also uses -32005 for rate limits, those are retried unchanged
+RATE_LIMITED = ('rate limit', 'too many requests', 'request rate', 'request count')
+LOG_RATE_LIMIT_RETRIES = int(os.environ.get('LOG_RATE_LIMIT_RETRIES', 5))
+LOG_RATE_LIMIT_BACKOFF = float(os.environ.get('LOG_RATE_LIMIT_BACKOFF', 2))
+
+
+def rate_limited(e):
+    message = str(e).lower()
+    return any(m in message for m in RATE_LIMITED)
+
+
+def too_many_results(e):
+    message = str(e).lower()
+    return not rate_limited(e) and any(m in message for m in TOO_MANY_RESULTS)
+
+
+def event_key(event):
+    return (event.contract.address, event.abi.name)
+
+
+def event_topic(event):
+    return encode_hex(keccak(text=event.abi.selector))
+
+
+class LogBatch:
+    def __init__(self):
+        self.logs = defaultdict(list)
+
+    def add(self, log):
+        self.logs[(log.contract_address, log.event_name)].append(log)
+
+    def get(self, event, search_topics=None):
+        logs = self.logs.get(event_key(event), [])
+        if not search_topics:
+            return list(logs)
+        return [
+            l for l in logs
+            if all(l.event_arguments.get(k) == v for k, v in search_topics.items())
+        ]
+
+    def since(self, block):
+        batch = LogBatch()
+        for key, logs in self.logs.items():
+            batch.logs[key] = [l for l in logs if l.block_number >= block]
+        return batch
+
+    def block_numbers(self):
+        return {l.block_number for logs in self.logs.values() for l in logs}
+
+    def __len__(self):
+        return sum(len(l) for l in self.logs.values())
+
+
+class LogScanner:
+    """
+    Fetches the logs for every subscribed event with one combined
+    address + topic filter per block chunk and routes each decoded log to
+    the LogBatch of the handlers that subscribed to it.
+
+    stream() is a generator: a chunk is only fetched once the previous one
+    has been consumed, so memory stays flat however large the window is.
+    The chunk size grows while results are sparse and shrinks on dense
+    chunks or when the provider rejects a query as too large. Rate limited
+    queries are retried with backoff at the same size.
+    """
+    def __init__(self, chunk_size=LOG_CHUNK_SIZE, max_chunk_size=LOG_CHUNK_MAX,
+                 target_results=LOG_TARGET_RESULTS):
+        self.chunk_size = chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.target_results = target_results
+        self.events = {}
+        self.routes = defaultdict(list)
+
+    def subscribe(self, handler, *events):
+        for event in events:
+            key = event_key(event)
+            self.events[key] = event
+            if handler not in self.routes[key]:
+                self.routes[key].append(handler)
+
+    @property
+    def handlers(self):
+        return list(dict.fromkeys(h for hs in self.routes.values() for h in hs))
+
+    def log_filter(self, start, stop, events=None):
+        events = self.events.values() if events is None else events
+        addresses = sorted({e.contract.address for e in events})
+        topics = sorted({event_topic(e) for e in events})
+        return {
+            'address': addresses,
+            'topics': [topics],
+            'fromBlock': hex(start),
+            'toBlock': hex(stop - 1),
+        }
+
+    def events_for(self, handlers):
+        return [self.events[key] for key, hs in self.routes.items() if set(hs) & set(handlers)]
+
+    def fetch(self, start, stop, events):
+        with span('scan'):
+            raw_logs = networks.provider.web3.eth.get_logs(self.log_filter(start, stop, events))
+        with span('decode'):
+            return decode_logs(raw_logs, events)
+
+    def scan(self, start, stop, handlers=None):
+        """
+        Scans [start, stop) with a single query and returns a LogBatch per
+        subscribed handler, limited to the events of `handlers` when given.
+        """
+        handlers = self.handlers if handlers is None else handlers
+        batches = {h: LogBatch() for h in handlers}
+        events = self.events_for(handlers)
+        if not events or start >= stop:
+            return batches
+        for log in self.fetch(start, stop, events):
+            # Identical event signatures on other watched contracts match
+            # the combined filter too, so route on (address, name).
+            for handler in self.routes.get((log.contract_address, log.event_name), []):
+                if handler in batches:
+                    batches[handler].add(log)
+        return batches
+
+    def resize(self, size, results):
+        if results > self.target_results:
+            return max(1, size * self.target_results // results)
+        if results < self.target_results // 2:
+            return min(self.max_chunk_size, size * 2)
+        return size
+
+    def stream(self, start, stop, active=None):
+        """
+        Yields (chunk_start, chunk_stop, batches) over [start, stop).
+        active(chunk_stop) picks the handlers to scan for in that chunk,
+        chunks without any are skipped.
+        """
+        cursor = start
+        retries = 0
+        while cursor < stop:
+            chunk_stop = min(cursor + self.chunk_size, stop)
+            handlers = self.handlers if active is None else active(chunk_stop)
+            if not handlers:
+                cursor = chunk_stop
+                continue
+            try:
+                batches = self.scan(cursor, chunk_stop, handlers)
+            except Exception as e:
+                if rate_limited(e) and retries < LOG_RATE_LIMIT_RETRIES:
+                    retries += 1
+                    delay = LOG_RATE_LIMIT_BACKOFF * 2 ** (retries - 1)
+                    print(f'Log query rate limited, retrying in {delay:.0f}s')
+                    time.sleep(delay)
+                    continue
+                if not too_many_results(e) or chunk_stop - cursor == 1:
+                    raise
+                self.chunk_size = max(1, (chunk_stop - cursor) // 2)
+                print(f'Log query for {chunk_stop - cursor} blocks rejected, retrying with {self.chunk_size}')
+                continue
+            retries = 0
+            yield cursor, chunk_stop, batches
+            results = sum(len(b) for b in batches.values())
+            self.chunk_size = self.resize(chunk_stop - cursor, results)
+            cursor = chunk_stop
@@ -0,0 +1,255 @@
+import json, os, threading, time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PATH = os.environ.get('ALERTS_METRICS_PATH')  # .json for JSON, Prometheus text otherwise
+METRICS_PORT = int(os.environ.get('ALERTS_METRICS_PORT', 0))
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Who is making the current call: the handler name and the pipeline stage
+handler_var = ContextVar('handler', default='-')
+stage_var = ContextVar('stage', default='-')
+
+
+@contextmanager
+def tagged(handler=None, stage=None):
+    tokens = []
+    if handler is not None:
+        tokens.append((handler_var, handler_var.set(handler)))
+    if stage is not None:
+        tokens.append((stage_var, stage_var.set(stage)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+def bind(fn):
+    """
+    fn wrapped to run with the caller's handler/stage tags. Worker threads
+    start from an empty context, wrap anything submitted to a pool.
+    """
+    context = copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total, out = 0, []
+        for bound, count in zip([*self.buckets, '+Inf'], self.counts):
+            total += count
+            out.append((bound, total))
+        return out
+
+
+class Metrics:
+    """
+    JSON-RPC usage per (handler, stage): calls and errors by method, and
+    per HTTP request the latency and payload bytes. A batch is one request
+    carrying many calls, which is how providers meter most plans.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.errors = Counter()
+        self.requests = Counter()
+        self.bytes_sent = Counter()
+        self.bytes_received = Counter()
+        self.latency = defaultdict(Histogram)
+        # (handler, stage): [count, wall seconds, cpu seconds], self time only
+        self.spans = defaultdict(lambda: [0, 0.0, 0.0])
+
+    def record(self, methods, seconds, sent=0, received=0, errors=(), tags=None):
+        """
+        One HTTP request carrying `methods`. tags replaces the context's
+        (handler, stage) for calls sent on another thread's behalf.
+        """
+        tags = tags or (handler_var.get(), stage_var.get())
+        transport = 'batch' if len(methods) > 1 else 'single'
+        with self.lock:
+            self._count(tags, methods, errors)
+            self.requests[(*tags, transport)] += 1
+            self.bytes_sent[tags] += sent
+            self.bytes_received[tags] += received
+            self.latency[(*tags, transport)].observe(seconds)
+
+    def record_calls(self, tags, methods, errors=()):
+        """Calls that rode along in a request recorded for other tags."""
+        with self.lock:
+            self._count(tags, methods, errors)
+
+    def _count(self, tags, methods, errors):
+        for method in methods:
+            self.calls[(*tags, method)] += 1
+        for method in errors:
+            self.errors[(*tags, method)] += 1
+
+    def record_span(self, handler, stage, wall, cpu):
+        with self.lock:
+            span = self.spans[(handler, stage)]
+            span[0] += 1
+            span[1] += wall
+            span[2] += cpu
+
+    def to_json(self):
+        with self.lock:
+            return {
+                'calls': [dict(handler=h, stage=s, method=m, count=n) for (h, s, m), n in self.calls.items()],
+                'errors': [dict(handler=h, stage=s, method=m, count=n) for (h, s, m), n in self.errors.items()],
+                'requests': [
+                    dict(handler=h, stage=s, transport=t, count=n,
+                         seconds=self.latency[(h, s, t)].sum,
+                         buckets=dict((str(b), c) for b, c in self.latency[(h, s, t)].cumulative()))
+                    for (h, s, t), n in self.requests.items()
+                ],
+                'bytes': [
+                    dict(handler=h, stage=s, sent=self.bytes_sent[(h, s)], received=self.bytes_received[(h, s)])
+                    for h, s in self.bytes_sent
+                ],
+                'stages': [
+                    dict(handler=h, stage=s, count=n, wall_seconds=wall, cpu_seconds=cpu)
+                    for (h, s), (n, wall, cpu) in self.spans.items()
+                ],
+            }
+
+    def to_prometheus(self):
+        lines = []
+
+        def metric(name, kind, help, samples, suffixes=('',)):
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for suffix, series in zip(suffixes, samples if len(suffixes) > 1 else [samples]):
+                for labels, value in series:
+                    label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+                    lines.append(f'{name}{suffix}{{{label_text}}} {value}')
+
+        with self.lock:
+            metric('alerts_rpc_calls_total', 'counter', 'JSON-RPC calls by method.', [
+                (dict(handler=h, stage=s, method=m), n) for (h, s, m), n in sorted(self.calls.items())
+            ])
+            metric('alerts_rpc_errors_total', 'counter', 'JSON-RPC calls answered with an error.', [
+                (dict(handler=h, stage=s, method=m), n) for (h, s, m), n in sorted(self.errors.items())
+            ])
+            metric('alerts_rpc_bytes_sent_total', 'counter', 'Request payload bytes.', [
+                (dict(handler=h, stage=s), n) for (h, s), n in sorted(self.bytes_sent.items())
+            ])
+            metric('alerts_rpc_bytes_received_total', 'counter', 'Response payload bytes.', [
+                (dict(handler=h, stage=s), n) for (h, s), n in sorted(self.bytes_received.items())
+            ])
+            buckets, sums, counts = [], [], []
+            for (h, s, t), histogram in sorted(self.latency.items()):
+                labels = dict(handler=h, stage=s, transport=t)
+                buckets += [({**labels, 'le': b}, c) for b, c in histogram.cumulative()]
+                sums.append((labels, histogram.sum))
+                counts.append((labels, histogram.count))
+            metric(
+                'alerts_rpc_request_seconds', 'histogram', 'HTTP request latency.',
+                [buckets, sums, counts], suffixes=('_bucket', '_sum', '_count'),
+            )
+            metric('alerts_stage_seconds_total', 'counter', 'Time spent in each stage, excluding nested stages.', [
+                (dict(handler=h, stage=s, clock=clock), value)
+                for (h, s), (_, wall, cpu) in sorted(self.spans.items())
+                for clock, value in (('wall', wall), ('cpu', cpu))
+            ])
+            metric('alerts_stage_spans_total', 'counter', 'Stage spans entered.', [
+                (dict(handler=h, stage=s), n) for (h, s), (n, _, _) in sorted(self.spans.items())
+            ])
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        by_handler = Counter()
+        with self.lock:
+            for (handler, _, _), n in self.calls.items():
+                by_handler[handler] += n
+        return ', '.join(f'{h}={n}' for h, n in by_handler.most_common())
+
+    def stages(self):
+        with self.lock:
+            rows = sorted(self.spans.items(), key=lambda i: -i[1][1])
+        return '\n'.join(
+            f'  {h:<24}{s:<10}{n:>7}{wall:>10.2f}s wall{cpu:>10.2f}s cpu'
+            for (h, s), (n, wall, cpu) in rows
+        )
+
+    def write(self, path=METRICS_PATH):
+        if not path:
+            return
+        text = json.dumps(self.to_json(), indent=2) if path.endswith('.json') else self.to_prometheus()
+        with open(path, 'w') as fp:
+            fp.write(text)
+
+
+metrics = Metrics()
+
+
+def instrument(provider):
+    """
+    Records every call made through a web3 provider. Safe to call more
+    than once.
+    """
+    if getattr(provider, '_alerts_metrics', False):
+        return
+    make_request = provider.make_request
+
+    def instrumented(method, params):
+        started = time.perf_counter()
+        sent = len(json.dumps(params, default=str))
+        try:
+            response = make_request(method, params)
+        except Exception:
+            metrics.record([method], time.perf_counter() - started, sent=sent, errors=[method])
+            raise
+        errors = [method] if 'error' in response else []
+        metrics.record([method], time.perf_counter() - started, sent=sent, errors=errors)
+        return response
+
+    provider.make_request = instrumented
+    provider._alerts_metrics = True
+    # web3 caches the middleware chain built around make_request
+    if hasattr(provider, '_request_func_cache'):
+        provider._request_func_cache = (None, None)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip('/') == '/metrics.json':
+            body, kind = json.dumps(metrics.to_json()), 'application/json'
+        elif self.path.rstrip('/') in ('', '/metrics'):
+            body, kind = metrics.to_prometheus(), 'text/plain; version=0.0.4'
+        else:
+            self.send_error(404)
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', kind)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port=METRICS_PORT):
+    """Serves /metrics and /metrics.json in a background thread."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer(('0.0.0.0', port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name='metrics').start()
+    print(f'Serving metrics on :{port}/metrics')
+    return server
@@ -0,0 +1,129 @@
+import os
+from collections import defaultdict
+from ape import networks
+from eth_abi import decode, encode
+from eth_utils import keccak, to_hex
+from hexbytes import HexBytes
+from _rpc import RPCError, batch_request
+from _tracing import span
+
+MULTICALL3 = os.environ.get('MULTICALL3_ADDRESS', '0xCA11BDe05779ba9376C1ed9f2Fd8dd0e4EA4f0bA')
+MULTICALL_SIZE = int(os.environ.get('MULTICALL_SIZE', 500))
+AGGREGATE3 = keccak(text='aggregate3((address,bool,bytes)[])')[:4]
+
+
+class CallFailed(Exception):
+    pass
+
+
+def reverted(error):
+    # Deterministic call failures, as opposed to throttling or node trouble
+    message = str(error).lower()
+    return 'revert' in message or 'invalid opcode' in message
+
+
+def block_param(block):
+    return block if isinstance(block, str) else hex(block)
+
+
+class Call:
+    def __init__(self, method, args, block, address=None):
+        self.abi = next(a for a in method.abis if len(a.inputs) == len(args))
+        self.target = address or method.contract.address
+        self.args = args
+        self.block = block
+        self.success = None
+        self.returndata = None
+        self.error = None
+
+    @property
+    def calldata(self):
+        ecosystem = networks.provider.network.ecosystem
+        return ecosystem.get_method_selector(self.abi) + ecosystem.encode_calldata(self.abi, *self.args)
+
+    @property
+    def value(self):
+        if not self.success:
+            raise CallFailed(f'{self.abi.name}{self.args} on {self.target} at {self.block}')
+        output = networks.provider.network.ecosystem.decode_returndata(self.abi, self.returndata)
+        if isinstance(output, (list, tuple)) and len(output) == 1:
+            return output[0]
+        return output
+
+    @property
+    def transient(self):
+        """True when the call failed for a reason that may not hold on retry."""
+        return self.error is not None and not reverted(self.error)
+
+    def get(self, default=None):
+        try:
+            return self.value
+        except Exception:
+            return default
+
+
+class Multicall:
+    """
+    Collects view calls and runs them as one Multicall3 aggregate3 per
+    distinct block, all blocks sent in a single JSON-RPC batch. Calls are
+    made with allowFailure, so a revert only fails its own Call.
+
+        mc = Multicall()
+        balance = mc.add(veyfi.balanceOf, user, block=block)
+        mc.execute()
+        balance.value
+    """
+    def __init__(self, block='latest'):
+        self.block = block
+        self.calls = []
+
+    def add(self, method, *args, block=None, address=None):
+        call = Call(method, args, self.block if block is None else block, address)
+        self.calls.append(call)
+        return call
+
+    def _aggregate(self, calls):
+        payload = encode(
+            ['(address,bool,bytes)[]'],
+            [[(c.target, True, bytes(c.calldata)) for c in calls]],
+        )
+        return {'to': MULTICALL3, 'data': to_hex(AGGREGATE3 + payload)}
+
+    @span('enrich')
+    def execute(self):
+        pending = [c for c in self.calls if c.success is None]
+        groups = defaultdict(list)
+        for call in pending:
+            groups[call.block].append(call)
+        requests = []
+        for block, calls in groups.items():
+            for i in range(0, len(calls), MULTICALL_SIZE):
+                requests.append((block, calls[i:i + MULTICALL_SIZE]))
+        try:
+            results = batch_request(
+                ('eth_call', [self._aggregate(calls), block_param(block)])
+                for block, calls in requests
+            )
+            for (block, calls), raw in zip(requests, results):
+                (decoded,) = decode(['(bool,bytes)[]'], HexBytes(raw))
+                for call, (success, returndata) in zip(calls, decoded):
+                    call.success = success and len(returndata) > 0
+                    call.returndata = returndata
+        except Exception as e:
+            # Multicall3 missing at that block (pre-deploy or a bare dev chain)
+            print(f'Multicall failed ({e}), falling back to individual calls')
+            self._execute_each(pending)
+        return self.calls
+
+    def _execute_each(self, calls):
+        results = batch_request(
+            (
+                ('eth_call', [{'to': c.target, 'data': to_hex(c.calldata)}, block_param(c.block)])
+                for c in calls
+            ),
+            raise_errors=False,
+        )
+        for call, raw in zip(calls, results):
+            call.success = not isinstance(raw, RPCError) and len(HexBytes(raw)) > 0
+            call.returndata = None if isinstance(raw, RPCError) else HexBytes(raw)
+            call.error = raw if isinstance(raw, RPCError) else None
@@ -0,0 +1,138 @@
+import os, time
+from typing import NamedTuple, Tuple
+
+
+class Network(NamedTuple):
+    name: str
+    chain_id: int
+    choice: str  # ape network choice, may end with a provider URI
+    address_book: str  # key of _contracts.ADDRESS_BOOKS
+    explorer: str
+    tenderly: str
+    solvers: Tuple[str, ...] = ()  # CoW solvers watched for settlements and reverts
+
+
+NETWORKS = {
+    'ethereum': Network(
+        'ethereum', 1, 'ethereum:mainnet', 'ethereum', 'https://etherscan.io/', 'mainnet',
+        ('0x398890BE7c4FAC5d766E1AEFFde44B2EE99F38EF', '0x8a4e90e9AFC809a69D2a3BDBE5fff17A12979609'),
+    ),
+}
+# Local dev chains (ape test, hardhat) run under any network's address book
+DEV_CHAIN_IDS = (1337, 31337)
+# Seconds between liveness checks, a dead network process is restarted on the next one
+RESTART_DELAY = float(os.environ.get('ALERTS_RESTART_DELAY', 30))
+
+
+def parse_networks(spec):
+    """
+    'ethereum' or, for forks and dev chains, name=choice items such
+    as 'fork-a=ethereum:local:http://127.0.0.1:8545'. Unknown names use the
+    ethereum address book and explorer.
+    """
+    found = []
+    for item in filter(None, (i.strip() for i in spec.split(','))):
+        name, _, choice = item.partition('=')
+        if not choice:
+            found.append(NETWORKS[name])
+            continue
+        base = NETWORKS.get(name, NETWORKS['ethereum'])
+        found.append(base._replace(name=name, choice=choice))
+    return found
+
+
+def current():
+    """
+    The network this process alerts for: ALERTS_NETWORK if set, else the
+    one matching the chain ape is connected to. Runs at import time, so
+    dev chains and chains without an entry fall back to ethereum here and
+    check_network() rejects the latter once main() starts.
+    """
+    name = os.environ.get('ALERTS_NETWORK')
+    if name:
+        if name in NETWORKS:
+            return NETWORKS[name]
+        return NETWORKS['ethereum']._replace(name=name)
+    from ape import networks
+    provider = networks.active_provider
+    if provider is None:
+        return NETWORKS['ethereum']
+    chain_id = provider.chain_id
+    for network in NETWORKS.values():
+        if network.chain_id == chain_id:
+            return network
+    return NETWORKS['ethereum']
+
+
+def check_network(network):
+    """Fails loudly when the connected chain is not the one `network` describes."""
+    from ape import networks
+    chain_id = networks.provider.chain_id
+    if chain_id != network.chain_id and chain_id not in DEV_CHAIN_IDS:
+        raise RuntimeError(
+            f'Connected to chain id {chain_id} but alerting for {network.name} '
+            f'(chain id {network.chain_id}), check ALERTS_NETWORK and --network, '
+            f'networks are configured in _networks.NETWORKS'
+        )
+
+
+def network_paths(network, index=0):
+    """
+    Files a network process writes, kept apart per network. Mainnet keeps
+    the original names so existing cursors carry over.
+    """
+    if network.name == 'ethereum':
+        return {}
+    env = {
+        'CURSORS_PATH': f'local_data.{network.name}.json',
+        'OUTBOX_PATH': f'outbox.{network.name}.sqlite',
+        'ALERTS_CACHE_DIR': os.path.join(os.environ.get('ALERTS_CACHE_DIR', '.alerts_cache'), network.name),
+    }
+    if os.environ.get('ALERTS_METRICS_PATH'):
+        root, ext = os.path.splitext(os.environ['ALERTS_METRICS_PATH'])
+        env['ALERTS_METRICS_PATH'] = f'{root}.{network.name}{ext}'
+    if os.environ.get('ALERTS_METRICS_PORT'):
+        env['ALERTS_METRICS_PORT'] = str(int(os.environ['ALERTS_METRICS_PORT']) + index)
+    return env
+
+
+def run_network(network, index):
+    """
+    Process entry point: connects to one network and follows it with the
+    daemon loop. The alert modules read their paths from the environment
+    when imported, so they are only imported here.
+    """
+    os.environ['ALERTS_NETWORK'] = network.name
+    os.environ.update(network_paths(network, index))
+    from ape import networks
+    with networks.parse_network_choice(network.choice):
+        import daemon
+        daemon.main()
+
+
+def supervise(selected, context):
+    """
+    One process per network, each with its own provider connection,
+    cursors and outbox, so a slow chain never holds up another. A process
+    that exits is started again after RESTART_DELAY.
+    """
+    processes = {}
+
+    def start(index, network):
+        process = context.Process(target=run_network, args=(network, index), name=f'alerts-{network.name}')
+        process.start()
+        processes[index] = process
+        print(f'Started {network.name} ({network.choice}) as pid {process.pid}')
+
+    for index, network in enumerate(selected):
+        start(index, network)
+    try:
+        while True:
+            time.sleep(RESTART_DELAY)
+            for index, network in enumerate(selected):
+                if not processes[index].is_alive():
+                    print(f'{network.name} exited with {processes[index].exitcode}, restarting')
+                    start(index, network)
+    except KeyboardInterrupt:
+        for process in processes.values():
+            process.join()
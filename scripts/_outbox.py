@@ -0,0 +1,189 @@
+import os, sqlite3, threading, time, traceback
+from collections import defaultdict, deque
+
+OUTBOX_PATH = os.environ.get('OUTBOX_PATH', 'outbox.sqlite')
+# Telegram allows ~30 msgs/s per bot and 20 msgs/min per group
+GLOBAL_RATE = (30, 1.0)
+CHAT_RATE = (20, 60.0)
+MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 10))
+MAX_BACKOFF = 300
+# Dropped messages are kept this long for inspection, then pruned
+FAILED_RETENTION = float(os.environ.get('OUTBOX_FAILED_RETENTION', 7 * 86_400))
+# The oldest undelivered message of each chat, only it may be sent
+HEADS = 'SELECT MIN(id) FROM outbox WHERE failed = 0 GROUP BY chat_id'
+
+
+class RateLimiter:
+    def __init__(self, limit, period):
+        self.limit = limit
+        self.period = period
+        self.sent = deque()
+
+    def wait_time(self, now):
+        while self.sent and now - self.sent[0] >= self.period:
+            self.sent.popleft()
+        if len(self.sent) < self.limit:
+            return 0
+        return self.period - (now - self.sent[0])
+
+    def record(self, now):
+        self.sent.append(now)
+
+
+def retry_after(e):
+    """
+    Seconds Telegram asked us to wait for a 429, None for any other error.
+    """
+    if getattr(e, 'error_code', None) != 429:
+        return None
+    params = (getattr(e, 'result_json', None) or {}).get('parameters', {})
+    return params.get('retry_after', 5)
+
+
+def permanent(e):
+    # 400/403 (bad markdown, bot kicked from chat) will never succeed
+    return getattr(e, 'error_code', None) in (400, 403)
+
+
+class Outbox:
+    """
+    Persistent Telegram outbox. Handlers enqueue rendered messages and a
+    background worker delivers them within Telegram's global and per-chat
+    limits, backing off on 429s and errors. Undelivered messages stay in
+    OUTBOX_PATH and are picked up again on the next start.
+    """
+    def __init__(self, send, path=OUTBOX_PATH):
+        self.send = send
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+        self.global_limit = RateLimiter(*GLOBAL_RATE)
+        self.chat_limits = defaultdict(lambda: RateLimiter(*CHAT_RATE))
+        self.paused_until = 0
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS outbox ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id TEXT, text TEXT, '
+            'created REAL, attempts INTEGER DEFAULT 0, next_attempt REAL DEFAULT 0, '
+            'failed INTEGER DEFAULT 0)'
+        )
+        self.db.commit()
+
+    def enqueue(self, chat_id, text):
+        with self.lock:
+            self.db.execute(
+                'INSERT INTO outbox (chat_id, text, created) VALUES (?, ?, ?)',
+                [str(chat_id), text, time.time()],
+            )
+            self.db.commit()
+        self.wakeup.set()
+
+    def pending(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM outbox WHERE failed = 0').fetchone()[0]
+
+    def _due(self, now):
+        # Keep per-chat order: a chat whose oldest message is backing off
+        # waits for it, newer messages never overtake it
+        with self.lock:
+            return self.db.execute(
+                f'SELECT id, chat_id, text, attempts FROM outbox '
+                f'WHERE id IN ({HEADS}) AND next_attempt <= ? ORDER BY id',
+                [now],
+            ).fetchall()
+
+    def _next_wakeup(self):
+        with self.lock:
+            row = self.db.execute(
+                f'SELECT MIN(next_attempt) FROM outbox WHERE id IN ({HEADS})'
+            ).fetchone()
+        return row[0]
+
+    def prune(self, now=None):
+        """Deletes dropped messages older than FAILED_RETENTION."""
+        now = time.time() if now is None else now
+        with self.lock:
+            self.db.execute(
+                'DELETE FROM outbox WHERE failed = 1 AND created < ?', [now - FAILED_RETENTION],
+            )
+            self.db.commit()
+
+    def _deliver(self, id, chat_id, text, attempts):
+        try:
+            self.send(chat_id, text)
+        except Exception as e:
+            now = time.time()
+            wait = retry_after(e)
+            if wait is not None:
+                self.paused_until = now + wait
+                next_attempt, attempts = now + wait, attempts
+            else:
+                attempts += 1
+                next_attempt = now + min(2 ** attempts, MAX_BACKOFF)
+            failed = permanent(e) or attempts >= MAX_ATTEMPTS
+            if failed:
+                print(f'Dropping message {id} to {chat_id} after {attempts} attempts: {e}')
+            with self.lock:
+                self.db.execute(
+                    'UPDATE outbox SET attempts = ?, next_attempt = ?, failed = ? WHERE id = ?',
+                    [attempts, next_attempt, int(failed), id],
+                )
+                self.db.commit()
+            return False
+        with self.lock:
+            self.db.execute('DELETE FROM outbox WHERE id = ?', [id])
+            self.db.commit()
+        return True
+
+    def _run(self):
+        while not self.stopping.is_set():
+            try:
+                now = time.time()
+                if now < self.paused_until:
+                    self.stopping.wait(self.paused_until - now)
+                    continue
+                for id, chat_id, text, attempts in self._due(now):
+                    now = time.time()
+                    wait = max(self.global_limit.wait_time(now), self.chat_limits[chat_id].wait_time(now))
+                    if wait > 0:
+                        # Try again once the limiter frees up
+                        self.stopping.wait(min(wait, 1.0))
+                        break
+                    self.global_limit.record(now)
+                    self.chat_limits[chat_id].record(now)
+                    if not self._deliver(id, chat_id, text, attempts) and time.time() < self.paused_until:
+                        break
+                else:
+                    next_attempt = self._next_wakeup()
+                    timeout = None if next_attempt is None else max(0.05, next_attempt - time.time())
+                    self.wakeup.wait(timeout)
+                    self.wakeup.clear()
+            except Exception:
+                traceback.print_exc()
+                self.stopping.wait(1.0)
+
+    def start(self):
+        self.prune()
+        if self.thread is None or not self.thread.is_alive():
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self._run, name='outbox', daemon=True)
+            self.thread.start()
+        self.wakeup.set()
+
+    def flush(self, timeout=60):
+        """
+        Waits until the outbox is empty (or timeout) and returns how many
+        messages are still pending.
+        """
+        deadline = time.time() + timeout
+        while self.pending() and time.time() < deadline:
+            self.wakeup.set()
+            time.sleep(0.1)
+        return self.pending()
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
@@ -0,0 +1,65 @@
+import os
+from _cache import LRUCache
+from _contracts import contract, has_contract
+from _multicall import Multicall
+
+PRICE_CACHE_SIZE = int(os.environ.get('PRICE_CACHE_SIZE', 2048))
+USDC_DECIMALS = 6
+
+
+class PriceService:
+    """
+    USD prices pinned to a block. The oracle is asked once per (token, block)
+    for the value of one whole token and amounts are scaled locally. Curve
+    virtual prices are cached per (pool, block) the same way.
+    """
+    def __init__(self, tokens, maxsize=PRICE_CACHE_SIZE):
+        self.tokens = tokens
+        self.prices = LRUCache(maxsize)
+        self.virtual_prices = LRUCache(maxsize)
+
+    def prefetch_prices(self, pairs):
+        missing = sorted({(token, block) for token, block in pairs if (token, block) not in self.prices})
+        if not missing or not has_contract('oracle'):
+            return
+        self.tokens.prefetch({token for token, _ in missing})
+        oracle = contract('oracle')
+        mc = Multicall()
+        calls = {
+            (token, block): mc.add(
+                oracle.getNormalizedValueUsdc, token, 10 ** self.tokens[token].decimals, block=block,
+            )
+            for token, block in missing
+            if self.tokens[token].ok
+        }
+        mc.execute()
+        for key, call in calls.items():
+            value = call.get()
+            if value is not None:
+                self.prices.set(key, value / 10 ** USDC_DECIMALS)
+
+    def price(self, token, block):
+        if (token, block) not in self.prices:
+            self.prefetch_prices([(token, block)])
+        return self.prices.get((token, block))
+
+    def value_usd(self, token, amount, block):
+        price = self.price(token, block)
+        if price is None:
+            return None
+        return amount / 10 ** self.tokens[token].decimals * price
+
+    def prefetch_virtual_prices(self, pool, blocks):
+        missing = sorted({b for b in blocks if (pool.address, b) not in self.virtual_prices})
+        if not missing:
+            return
+        mc = Multicall()
+        calls = {b: mc.add(pool.get_virtual_price, block=b) for b in missing}
+        mc.execute()
+        for block, call in calls.items():
+            self.virtual_prices.set((pool.address, block), call.value)
+
+    def virtual_price(self, pool, block):
+        if (pool.address, block) not in self.virtual_prices:
+            self.prefetch_virtual_prices(pool, [block])
+        return self.virtual_prices.get((pool.address, block))
@@ -0,0 +1,128 @@
+import os
+from collections import defaultdict
+from ape import networks
+from eth_utils import to_hex
+from hexbytes import HexBytes
+from _rpc import RPCError, batch_request
+from _tracing import span
+
+# Use eth_getBlockReceipts once a block holds at least this many wanted txns
+BLOCK_RECEIPTS_THRESHOLD = int(os.environ.get('BLOCK_RECEIPTS_THRESHOLD', 8))
+
+QUANTITY_FIELDS = {
+    'blockNumber', 'transactionIndex', 'logIndex', 'gas', 'gasPrice', 'gasUsed',
+    'cumulativeGasUsed', 'effectiveGasPrice', 'maxFeePerGas', 'maxPriorityFeePerGas',
+    'nonce', 'value', 'type', 'status', 'chainId', 'v',
+}
+BYTES_FIELDS = {'input', 'data', 'r', 's'}
+
+
+def hash_key(txn_hash):
+    if isinstance(txn_hash, (bytes, bytearray)):
+        txn_hash = to_hex(txn_hash)
+    return txn_hash.lower()
+
+
+def normalize(data):
+    out = {}
+    for key, value in data.items():
+        if value is None:
+            out[key] = value
+        elif key in QUANTITY_FIELDS and isinstance(value, str):
+            out[key] = int(value, 16)
+        elif key in BYTES_FIELDS:
+            out[key] = HexBytes(value)
+        elif key == 'topics':
+            out[key] = [HexBytes(t) for t in value]
+        elif key == 'logs':
+            out[key] = [normalize(l) for l in value]
+        else:
+            out[key] = value
+    return out
+
+
+class ReceiptStore:
+    """
+    Transaction receipts keyed by tx hash. Handlers prefetch the hashes they
+    need for a window, which are fetched as JSON-RPC batches (or one
+    eth_getBlockReceipts per busy block), and then read them from memory.
+    Safe to share between handler threads: entries are only ever added, and
+    two threads racing on the same hash at worst fetch it twice.
+    """
+    def __init__(self):
+        self.raw = {}
+        self.receipts = {}
+        self.block_receipts_supported = True
+
+    def __contains__(self, txn_hash):
+        return hash_key(txn_hash) in self.raw
+
+    @span('enrich')
+    def prefetch(self, refs):
+        """
+        refs: iterable of (txn_hash, block_number), block_number may be None.
+        """
+        by_block = defaultdict(set)
+        for txn_hash, block_number in refs:
+            key = hash_key(txn_hash)
+            if key not in self.raw:
+                by_block[block_number].add(key)
+        single = set(by_block.pop(None, set()))
+        busy = []
+        for block_number, hashes in by_block.items():
+            if self.block_receipts_supported and len(hashes) >= BLOCK_RECEIPTS_THRESHOLD:
+                busy.append(block_number)
+            else:
+                single |= hashes
+        if busy:
+            try:
+                self._fetch_blocks(busy)
+            except RPCError:
+                self.block_receipts_supported = False
+                single |= {h for b in busy for h in by_block[b]}
+        if single:
+            self._fetch_hashes(sorted(single))
+
+    def prefetch_logs(self, logs):
+        self.prefetch((l.transaction_hash, l.block_number) for l in logs)
+
+    def _fetch_hashes(self, hashes):
+        calls = []
+        for h in hashes:
+            calls.append(('eth_getTransactionByHash', [h]))
+            calls.append(('eth_getTransactionReceipt', [h]))
+        results = batch_request(calls)
+        for h, txn, receipt in zip(hashes, results[::2], results[1::2]):
+            if txn is not None and receipt is not None:
+                self.raw[h] = normalize({**txn, **receipt})
+
+    def _fetch_blocks(self, block_numbers):
+        calls = []
+        for n in block_numbers:
+            calls.append(('eth_getBlockByNumber', [hex(n), True]))
+            calls.append(('eth_getBlockReceipts', [hex(n)]))
+        results = batch_request(calls)
+        for block, receipts in zip(results[::2], results[1::2]):
+            txns = {hash_key(t['hash']): t for t in block['transactions']}
+            for receipt in receipts:
+                h = hash_key(receipt['transactionHash'])
+                self.raw[h] = normalize({**txns[h], **receipt})
+
+    def get_raw(self, txn_hash):
+        key = hash_key(txn_hash)
+        if key not in self.raw:
+            self._fetch_hashes([key])
+        return self.raw[key]
+
+    def __getitem__(self, txn_hash):
+        key = hash_key(txn_hash)
+        if key not in self.receipts:
+            data = self.get_raw(key)
+            ecosystem = networks.provider.network.ecosystem
+            with span('decode'):
+                self.receipts[key] = ecosystem.decode_receipt(dict(data))
+        return self.receipts[key]
+
+    def clear(self):
+        self.raw.clear()
+        self.receipts.clear()
@@ -0,0 +1,153 @@
+import json, os, threading, time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+
+REPLAY_TIMEOUT = int(os.environ.get('REPLAY_TIMEOUT', 60))
+
+
+def fixture_key(method, params):
+    return json.dumps([method, params], sort_keys=True, separators=(',', ':'))
+
+
+class Fixtures:
+    """
+    Recorded JSON-RPC responses keyed by (method, params), stored as one
+    JSON file. When an upstream is given, calls missing from the file are
+    forwarded to it and recorded, otherwise they are answered with an error.
+    """
+    def __init__(self, path, upstream=None):
+        self.path = path
+        self.upstream = upstream
+        try:
+            with open(path, 'r') as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            data = {}
+        self.meta = data.get('meta', {})
+        self.responses = data.get('responses', {})
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def answer(self, method, params):
+        key = fixture_key(method, params)
+        with self.lock:
+            response = self.responses.get(key)
+        if response is not None:
+            return response, True
+        if self.upstream is None:
+            return {'error': {'code': -32000, 'message': f'{method} not in fixture'}}, False
+        body = requests.post(
+            self.upstream, json={'jsonrpc': '2.0', 'id': 1, 'method': method, 'params': params},
+            timeout=REPLAY_TIMEOUT,
+        ).json()
+        response = {k: body[k] for k in ('result', 'error') if k in body}
+        with self.lock:
+            self.responses[key] = response
+            self.dirty = True
+        return response, True
+
+    def save(self):
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'w') as fp:
+            json.dump({'meta': self.meta, 'responses': self.responses}, fp)
+        self.dirty = False
+
+
+class RPCStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.calls = Counter()
+            self.misses = Counter()
+
+    def record(self, methods, misses):
+        with self.lock:
+            self.requests += 1
+            self.calls.update(methods)
+            self.misses.update(misses)
+
+    def snapshot(self):
+        with self.lock:
+            return {'requests': self.requests, 'calls': dict(self.calls), 'misses': dict(self.misses)}
+
+
+class _RPCHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        items = body if isinstance(body, list) else [body]
+        replies, misses = [], []
+        for item in items:
+            response, hit = self.server.fixtures.answer(item['method'], item.get('params', []))
+            if not hit:
+                misses.append(item['method'])
+            replies.append({'jsonrpc': '2.0', 'id': item.get('id'), **response})
+        self.server.stats.record([i['method'] for i in items], misses)
+        self._reply(replies if isinstance(body, list) else replies[0])
+
+    def _reply(self, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class _TelegramHandler(_RPCHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        with self.server.lock:
+            self.server.sent += 1
+            message_id = self.server.sent
+        self._reply({'ok': True, 'result': {
+            'message_id': message_id, 'date': int(time.time()),
+            'chat': {'id': 0, 'type': 'group'}, 'text': '',
+        }})
+
+
+def _serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_address[1]}'
+
+
+class ReplayServer:
+    """
+    Local JSON-RPC endpoint answering from Fixtures, counting every call by
+    method. Point the provider at .uri to run fully offline.
+    """
+    def __init__(self, fixtures):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _RPCHandler)
+        self.server.fixtures = fixtures
+        self.server.stats = self.stats = RPCStats()
+        self.uri = _serve(self.server)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeTelegram:
+    """Accepts any Bot API call and counts it, for TELEGRAM_API_URL."""
+    def __init__(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _TelegramHandler)
+        self.server.lock = threading.Lock()
+        self.server.sent = 0
+        self.uri = _serve(self.server)
+
+    @property
+    def sent(self):
+        return self.server.sent
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
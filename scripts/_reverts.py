@@ -0,0 +1,53 @@
+import os, time
+from concurrent.futures import ThreadPoolExecutor
+from _rpc import RPCError, batch_request
+from _metrics import bind
+
+# Full blocks are large, keep each JSON-RPC batch modest
+REVERT_BLOCK_BATCH = int(os.environ.get('REVERT_BLOCK_BATCH', 20))
+REVERT_WORKERS = int(os.environ.get('REVERT_WORKERS', 4))
+
+
+def sent_in_range(senders, start, stop):
+    """
+    (txn_hash, block_number, sender) for every txn in [start, stop) whose
+    raw `from` is one of senders (lowercase).
+    """
+    calls = [('eth_getBlockByNumber', [hex(b), True]) for b in range(start, stop)]
+    matches = []
+    for number, block in zip(range(start, stop), batch_request(calls, coalesce=False)):
+        if block is None:
+            # Lagging nodes answer null for blocks they lack, the chunk is retried
+            raise RPCError(f'block {number} not found')
+        for txn in block['transactions']:
+            sender = txn['from'].lower()
+            if sender in senders:
+                matches.append((txn['hash'], int(block['number'], 16), sender))
+    return matches
+
+
+def find_failed(receipts, senders, start, stop, batch=REVERT_BLOCK_BATCH, workers=REVERT_WORKERS):
+    """
+    Scans [start, stop) for reverted txns sent by any of senders. Full blocks
+    are fetched in JSON-RPC batches spread over a worker pool, then only the
+    matching receipts are fetched, in bulk. Returns [(txn_hash, sender)].
+    """
+    if start >= stop:
+        return []
+    senders = {s.lower() for s in senders}
+    ranges = [(b, min(b + batch, stop)) for b in range(start, stop, batch)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reverts') as pool:
+        matches = [m for ms in pool.map(bind(lambda r: sent_in_range(senders, *r)), ranges) for m in ms]
+    receipts.prefetch((txn_hash, block) for txn_hash, block, _ in matches)
+    failed = [
+        (txn_hash, sender) for txn_hash, _, sender in matches
+        if receipts.get_raw(txn_hash)['status'] == 0
+    ]
+    elapsed = time.perf_counter() - started
+    print(
+        f'Revert scan: {stop - start} blocks in {elapsed:.2f}s '
+        f'({(stop - start) / max(elapsed, 1e-9):,.1f} blocks/sec), '
+        f'{len(matches)} txns from watched senders, {len(failed)} failed'
+    )
+    return failed
@@ -0,0 +1,121 @@
+import os, time
+from collections import defaultdict
+from functools import lru_cache
+from ape import networks
+from _metrics import handler_var, metrics, stage_var
+from _transport import RPC_CONNECT_TIMEOUT, RPC_TIMEOUT, RpcBatcher, rpc_session
+
+RPC_BATCH_SIZE = int(os.environ.get('RPC_BATCH_SIZE', 100))
+# Merge batch_request calls made at the same time by different threads
+RPC_AUTO_BATCH = os.environ.get('RPC_AUTO_BATCH', '1') == '1'
+
+
+class RPCError(Exception):
+    pass
+
+
+def endpoint_uri():
+    uri = getattr(networks.provider.web3.provider, 'endpoint_uri', None)
+    if uri and str(uri).startswith('http'):
+        return str(uri)
+    return None
+
+
+def request(method, params, raise_errors=True):
+    response = networks.provider.web3.provider.make_request(method, params)
+    if 'error' in response:
+        error = RPCError(f'{method}: {response["error"]}')
+        if raise_errors:
+            raise error
+        return error
+    return response['result']
+
+
+def _record(calls, elapsed, sent, received, failed, tags):
+    if tags is None:
+        metrics.record([m for m, _ in calls], elapsed, sent, received, [calls[i][0] for i in failed])
+        return
+    groups = defaultdict(list)
+    for i, tag in enumerate(tags):
+        groups[tag].append(i)
+    failed = set(failed)
+    for n, (tag, indexes) in enumerate(groups.items()):
+        methods = [calls[i][0] for i in indexes]
+        errors = [calls[i][0] for i in indexes if i in failed]
+        if n == 0:
+            metrics.record(methods, elapsed, sent, received, errors, tags=tag)
+        else:
+            metrics.record_calls(tag, methods, errors)
+
+
+def _post_batch(uri, calls, raise_errors=True, tags=None):
+    """tags: (handler, stage) per call when sending on behalf of other threads."""
+    payload = [
+        {'jsonrpc': '2.0', 'id': i, 'method': method, 'params': params}
+        for i, (method, params) in enumerate(calls)
+    ]
+    everything = range(len(calls))
+    started = time.perf_counter()
+    response = rpc_session().post(uri, json=payload, timeout=(RPC_CONNECT_TIMEOUT, RPC_TIMEOUT))
+    elapsed = time.perf_counter() - started
+    sent, received = len(response.request.body or b''), len(response.content)
+    if not response.ok:
+        _record(calls, elapsed, sent, received, everything, tags)
+    response.raise_for_status()
+    body = response.json()
+    if not isinstance(body, list):
+        _record(calls, elapsed, sent, received, everything, tags)
+        # Some providers answer a rejected batch with a single error object
+        raise RPCError(f'batch rejected: {body.get("error", body)}')
+    _record(calls, elapsed, sent, received, [i['id'] for i in body if 'error' in i], tags)
+    results = [None] * len(calls)
+    for item in body:
+        if 'error' in item:
+            method = calls[item['id']][0]
+            error = RPCError(f'{method}: {item["error"]}')
+            if raise_errors:
+                raise error
+            results[item['id']] = error
+        else:
+            results[item['id']] = item['result']
+    return results
+
+
+def _send_queued(queued):
+    calls = [(method, params) for method, params, _ in queued]
+    return _post_batch(endpoint_uri(), calls, raise_errors=False, tags=[tag for *_, tag in queued])
+
+
+@lru_cache(maxsize=None)
+def batcher():
+    return RpcBatcher(_send_queued, RPC_BATCH_SIZE)
+
+
+def batch_request(calls, raise_errors=True, coalesce=RPC_AUTO_BATCH):
+    """
+    Sends [(method, params), ...] as JSON-RPC batches of at most
+    RPC_BATCH_SIZE calls and returns the results in order. Falls back to
+    one request per call for non-HTTP providers. With raise_errors=False a
+    failed call leaves its RPCError in the results instead of raising.
+
+    With coalesce the calls join the shared batcher queue, so handlers
+    enriching at the same time share round trips. Pass coalesce=False for
+    calls with large responses that must keep their own batch size.
+    """
+    calls = list(calls)
+    uri = endpoint_uri()
+    if uri is None:
+        return [request(method, params, raise_errors) for method, params in calls]
+    if coalesce:
+        tag = (handler_var.get(), stage_var.get())
+        futures = [batcher().submit(method, params, tag) for method, params in calls]
+        results = [future.result() for future in futures]
+        if raise_errors:
+            for result in results:
+                if isinstance(result, RPCError):
+                    raise result
+        return results
+    results = []
+    for i in range(0, len(calls), RPC_BATCH_SIZE):
+        results += _post_batch(uri, calls[i:i + RPC_BATCH_SIZE], raise_errors)
+    return results
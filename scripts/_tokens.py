@@ -0,0 +1,134 @@
+import os, threading, time
+from typing import NamedTuple, Optional
+from ape import networks, project
+from ape.contracts import ContractInstance
+from _cache import connect
+from _multicall import Multicall
+from _tracing import span
+
+# Failed lookups are retried after this many seconds
+TOKEN_RETRY_AFTER = int(os.environ.get('TOKEN_RETRY_AFTER', 7 * 24 * 60 * 60))
+# Lookups hit by RPC errors rather than reverts are retried much sooner
+TOKEN_TRANSIENT_RETRY = int(os.environ.get('TOKEN_TRANSIENT_RETRY', 60))
+
+ETH = '0xEeeeeEeeeEeEeeEeEeEeeEEEeeeeEeeeeeeeEEeE'
+KNOWN_TOKENS = {
+    ETH: ('ETH', 18, 'Ether'),
+    # symbol() and name() return bytes32
+    '0x9f8F72aA9304c8B593d555F12eF6589cC3A579A2': ('MKR', 18, 'Maker'),
+    '0x89d24A6b4CcB1B6fAA2625fE562bDD9a23260359': ('SAI', 18, 'Dai Stablecoin v1.0'),
+}
+
+
+class Token(NamedTuple):
+    address: str
+    symbol: Optional[str]
+    decimals: Optional[int]
+    name: Optional[str]
+
+    @property
+    def ok(self):
+        return self.symbol is not None and self.decimals is not None
+
+
+def decode_text(call):
+    try:
+        return call.value
+    except Exception:
+        pass
+    # bytes32 symbols/names (MKR, SAI, ...)
+    if call.success and call.returndata and len(call.returndata) == 32:
+        return bytes(call.returndata).rstrip(b'\0').decode('utf-8', errors='ignore') or None
+    return None
+
+
+class TokenRegistry:
+    """
+    Process-wide symbol/decimals/name lookups, persisted to SQLite. Tokens
+    whose lookups revert or return nothing are cached as failures and only
+    retried after TOKEN_RETRY_AFTER seconds. Lookups that hit an RPC error
+    are never persisted and retried after TOKEN_TRANSIENT_RETRY seconds.
+    """
+    def __init__(self):
+        self.tokens = {a: Token(a, *meta) for a, meta in KNOWN_TOKENS.items()}
+        self.failed = {}
+        self.transient = {}
+        self._db = None
+        self._chain_id = None
+        self.lock = threading.RLock()
+
+    @property
+    def chain_id(self):
+        if self._chain_id is None:
+            self._chain_id = networks.provider.chain_id
+        return self._chain_id
+
+    @property
+    def db(self):
+        with self.lock:
+            if self._db is None:
+                self._db = connect()
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS tokens ('
+                    'chain_id INTEGER, address TEXT, symbol TEXT, decimals INTEGER, name TEXT, '
+                    'failed_at INTEGER, PRIMARY KEY (chain_id, address))'
+                )
+                rows = self._db.execute(
+                    'SELECT address, symbol, decimals, name, failed_at FROM tokens WHERE chain_id = ?',
+                    [self.chain_id],
+                )
+                for address, symbol, decimals, name, failed_at in rows:
+                    if address in KNOWN_TOKENS:
+                        continue
+                    self.tokens[address] = Token(address, symbol, decimals, name)
+                    if failed_at:
+                        self.failed[address] = failed_at
+            return self._db
+
+    def _stale(self, address):
+        if address not in self.tokens:
+            return True
+        if address in self.transient:
+            return time.time() - self.transient[address] > TOKEN_TRANSIENT_RETRY
+        failed_at = self.failed.get(address)
+        return failed_at is not None and time.time() - failed_at > TOKEN_RETRY_AFTER
+
+    @span('enrich')
+    def prefetch(self, addresses):
+        self.db  # loads persisted tokens on first use
+        missing = sorted({a for a in addresses if self._stale(a)})
+        if not missing:
+            return
+        mc = Multicall()
+        calls = {}
+        for address in missing:
+            contract = ContractInstance(address, project.ERC20.contract_type)
+            calls[address] = (
+                mc.add(contract.symbol), mc.add(contract.decimals), mc.add(contract.name),
+            )
+        mc.execute()
+        rows = []
+        now = int(time.time())
+        with self.lock:
+            for address, (symbol, decimals, name) in calls.items():
+                token = Token(address, decode_text(symbol), decimals.get(), decode_text(name))
+                if any(c.transient for c in (symbol, decimals, name)):
+                    self.tokens[address] = token
+                    self.transient[address] = now
+                    continue
+                self.transient.pop(address, None)
+                failed_at = None if token.ok else now
+                self.tokens[address] = token
+                if failed_at:
+                    self.failed[address] = failed_at
+                else:
+                    self.failed.pop(address, None)
+                rows.append((self.chain_id, *token, failed_at))
+            if rows:
+                self.db.executemany('INSERT OR REPLACE INTO tokens VALUES (?, ?, ?, ?, ?, ?)', rows)
+            self.db.commit()
+
+    def __getitem__(self, address):
+        if self._stale(address):
+            self.prefetch([address])
+        return self.tokens[address]
@@ -0,0 +1,130 @@
+import cProfile, os, sys, threading, time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from _metrics import metrics, handler_var, tagged
+
+# ALERTS_PROFILE=alert_veyfi_locks,alert_bribes (or "all") profiles those handlers.
+# sample: folded stacks for flamegraph.pl / speedscope, cprofile: pstats dump
+PROFILE = {h for h in os.environ.get('ALERTS_PROFILE', '').split(',') if h}
+PROFILE_MODE = os.environ.get('ALERTS_PROFILE_MODE', 'sample')
+PROFILE_DIR = os.environ.get('ALERTS_PROFILE_DIR', 'profiles')
+PROFILE_INTERVAL = float(os.environ.get('ALERTS_PROFILE_INTERVAL', 0.005))
+
+_current = ContextVar('span', default=None)
+
+
+class _Span:
+    __slots__ = ('child_wall', 'child_cpu')
+
+    def __init__(self):
+        self.child_wall = 0.0
+        self.child_cpu = 0.0
+
+
+@contextmanager
+def span(stage):
+    """
+    Times a pipeline stage (scan, decode, enrich, render, send) for the
+    current handler, in wall and thread CPU time. Nested spans are
+    subtracted from their parent so each stage only counts its own time,
+    and RPC calls inside are tagged with the stage.
+    """
+    parent = _current.get()
+    current = _Span()
+    token = _current.set(current)
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        with tagged(stage=stage):
+            yield
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+        _current.reset(token)
+        if parent is not None:
+            parent.child_wall += wall
+            parent.child_cpu += cpu
+        metrics.record_span(
+            handler_var.get(), stage, wall - current.child_wall, cpu - current.child_cpu,
+        )
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class Sampler:
+    """
+    Samples one thread's stack every PROFILE_INTERVAL seconds from a
+    background thread and keeps the counts as folded stacks.
+    """
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+
+    def _sample(self, ident, stop):
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(ident)
+            stack = []
+            while frame is not None:
+                stack.append(frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    @contextmanager
+    def running(self):
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=self._sample, args=(threading.get_ident(), stop), daemon=True, name='sampler',
+        )
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def dump(self, path):
+        with open(path, 'w') as fp:
+            for stack, count in self.stacks.items():
+                fp.write(f'{stack} {count}\n')
+
+
+_profilers = {}
+_profilers_lock = threading.Lock()
+# Only one deterministic profiler can be active per process
+_cprofile_lock = threading.Lock()
+
+
+def profiler(name):
+    with _profilers_lock:
+        if name not in _profilers:
+            _profilers[name] = Sampler() if PROFILE_MODE == 'sample' else cProfile.Profile()
+        return _profilers[name]
+
+
+@contextmanager
+def _profiled(name):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    prof = profiler(name)
+    if isinstance(prof, Sampler):
+        with prof.running():
+            yield
+        # Rewritten after every chunk, samples accumulate over the run
+        prof.dump(os.path.join(PROFILE_DIR, f'{name}.folded'))
+    else:
+        with _cprofile_lock:
+            prof.enable()
+            try:
+                yield
+            finally:
+                prof.disable()
+                prof.dump_stats(os.path.join(PROFILE_DIR, f'{name}.prof'))
+
+
+def profiled(name):
+    """Profiles the block when ALERTS_PROFILE selects handler `name`."""
+    if name in PROFILE or 'all' in PROFILE:
+        return _profiled(name)
+    return nullcontext()
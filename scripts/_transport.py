@@ -0,0 +1,128 @@
+import os, queue, threading, time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RPC_POOL_SIZE = int(os.environ.get('RPC_POOL_SIZE', 16))
+RPC_CONNECT_TIMEOUT = float(os.environ.get('RPC_CONNECT_TIMEOUT', 5))
+RPC_TIMEOUT = int(os.environ.get('RPC_TIMEOUT', 30))
+RPC_RETRIES = int(os.environ.get('RPC_RETRIES', 2))
+TELEGRAM_POOL_SIZE = int(os.environ.get('TELEGRAM_POOL_SIZE', 4))
+TELEGRAM_CONNECT_TIMEOUT = float(os.environ.get('TELEGRAM_CONNECT_TIMEOUT', 5))
+TELEGRAM_READ_TIMEOUT = float(os.environ.get('TELEGRAM_READ_TIMEOUT', 30))
+# Calls queued within this many seconds of each other share one HTTP batch
+RPC_BATCH_LINGER = float(os.environ.get('RPC_BATCH_LINGER', 0.002))
+RPC_BATCH_WORKERS = int(os.environ.get('RPC_BATCH_WORKERS', 4))
+
+
+def pooled_session(pool_size, retry=None):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry or 0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+@lru_cache(maxsize=None)
+def rpc_session():
+    """
+    Keep-alive session shared by web3 and the batch helpers. Reads are
+    idempotent, so throttling and gateway errors are retried.
+    """
+    retry = Retry(
+        total=RPC_RETRIES, backoff_factor=0.5, status_forcelist=(429, 502, 503, 504),
+        allowed_methods=None, raise_on_status=False,
+    )
+    return pooled_session(RPC_POOL_SIZE, retry)
+
+
+@lru_cache(maxsize=None)
+def telegram_session():
+    # No transport retries, the outbox owns retrying sends
+    return pooled_session(TELEGRAM_POOL_SIZE)
+
+
+def install_web3(provider):
+    """
+    Sends a web3 HTTPProvider's requests through rpc_session with our
+    timeouts. web3 keeps one session per thread and URI and always hands
+    back the one it cached first (ape has made requests by now), so its
+    make_request is replaced rather than its session cache seeded.
+    """
+    uri = getattr(provider, 'endpoint_uri', None)
+    if not uri or not str(uri).startswith('http') or getattr(provider, '_alerts_transport', False):
+        return
+    uri = str(uri)
+    get_headers = getattr(provider, 'get_request_headers', None)
+    headers = dict(get_headers()) if get_headers else {'Content-Type': 'application/json'}
+
+    def make_request(method, params):
+        response = rpc_session().post(
+            uri, data=provider.encode_rpc_request(method, params), headers=headers,
+            timeout=(RPC_CONNECT_TIMEOUT, RPC_TIMEOUT),
+        )
+        response.raise_for_status()
+        return provider.decode_rpc_response(response.content)
+
+    provider.make_request = make_request
+    provider._alerts_transport = True
+    # web3 caches the middleware chain built around make_request
+    if hasattr(provider, '_request_func_cache'):
+        provider._request_func_cache = (None, None)
+
+
+def install_telebot():
+    import telebot
+    telebot.apihelper.CUSTOM_REQUEST_SENDER = telegram_session().request
+    telebot.apihelper.CONNECT_TIMEOUT = TELEGRAM_CONNECT_TIMEOUT
+    telebot.apihelper.READ_TIMEOUT = TELEGRAM_READ_TIMEOUT
+
+
+class RpcBatcher:
+    """
+    Coalesces JSON-RPC calls queued from any thread into batches of at most
+    max_size. A batch leaves once it is full or nothing new was queued for
+    `linger` seconds; up to `workers` batches are in flight at once.
+
+    send([(method, params, tag), ...]) returns one result or exception per
+    call, tag is whatever the caller attached (e.g. metrics labels).
+    """
+    def __init__(self, send, max_size, linger=RPC_BATCH_LINGER, workers=RPC_BATCH_WORKERS):
+        self.send = send
+        self.max_size = max_size
+        self.linger = linger
+        self.queue = queue.SimpleQueue()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='rpc-batch')
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, method, params, tag=None):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='rpc-batcher', daemon=True)
+                self.thread.start()
+        future = Future()
+        self.queue.put((method, params, tag, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.max_size:
+                try:
+                    batch.append(self.queue.get(timeout=self.linger))
+                except queue.Empty:
+                    break
+            self.pool.submit(self._send, batch)
+
+    def _send(self, batch):
+        try:
+            results = self.send([(method, params, tag) for method, params, tag, _ in batch])
+        except BaseException as e:
+            for *_, future in batch:
+                future.set_exception(e)
+            return
+        for (*_, future), result in zip(batch, results):
+            future.set_result(result)
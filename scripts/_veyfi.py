@@ -0,0 +1,78 @@
+from collections import defaultdict
+from typing import NamedTuple
+from _multicall import Multicall
+
+
+class Deposit(NamedTuple):
+    txn_hash: str
+    block: int
+    log_index: int
+    user: str
+    amount: int
+
+
+def correlate(logs):
+    """
+    Pairs every Supply increase with the user of its ModifyLock. One
+    modify_lock call logs a ModifyLock and a Supply next to each other,
+    so logs are walked in log index order per transaction and each Supply
+    is joined with the adjacent unpaired ModifyLock, whichever of the two
+    comes first. A transaction locking for several users yields one
+    Deposit per user. Supply decreases come from withdrawals, which log
+    no ModifyLock, and are skipped.
+    """
+    by_txn = defaultdict(list)
+    for log in logs:
+        by_txn[log.transaction_hash].append(log)
+    deposits = []
+    for txn_hash, txn_logs in by_txn.items():
+        modify_lock = supply = None
+        for log in sorted(txn_logs, key=lambda l: l.log_index):
+            if log.event_name == 'ModifyLock':
+                modify_lock = log
+            elif log.event_name == 'Supply':
+                args = log.event_arguments
+                if args['new_supply'] < args['old_supply']:
+                    continue
+                supply = log
+            else:
+                continue
+            if modify_lock is None or supply is None:
+                continue
+            args = supply.event_arguments
+            amount = args['new_supply'] - args['old_supply']
+            if amount > 0:
+                deposits.append(Deposit(
+                    txn_hash, supply.block_number, supply.log_index,
+                    modify_lock.event_arguments['user'], amount,
+                ))
+            modify_lock = supply = None
+        if supply is not None:
+            print(f'Supply without a ModifyLock in {txn_hash} at log {supply.log_index}')
+    return deposits
+
+
+class LockStates:
+    """
+    The veYFI reads the alerts need for a whole window, queued on one
+    Multicall. Identical (method, user, block) reads are only made once.
+    """
+    def __init__(self, veyfi):
+        self.veyfi = veyfi
+        self.mc = Multicall()
+        self.calls = {}
+
+    def _add(self, name, user, block):
+        key = (name, user, block)
+        if key not in self.calls:
+            self.calls[key] = self.mc.add(getattr(self.veyfi, name), user, block=block)
+        return self.calls[key]
+
+    def balance(self, user, block):
+        return self._add('balanceOf', user, block)
+
+    def locked(self, user, block):
+        return self._add('locked', user, block)
+
+    def execute(self):
+        self.mc.execute()
@@ -0,0 +1,31 @@
+import json, os
+from ape import Contract
+from _contracts import CONTRACTS
+
+# Regenerates the vendored ABIs in contracts/ from the explorer.
+# Only the events and view functions the alert handlers use are kept, set
+# ABI_BUNDLE_FULL=1 to write the full ABIs instead.
+KEEP = {
+    'VeYFI': {'ModifyLock', 'Withdraw', 'Penalty', 'Supply', 'balanceOf', 'totalSupply', 'locked'},
+    'CurveYcrvPool': {'TokenExchange', 'AddLiquidity', 'RemoveLiquidity', 'get_virtual_price', 'coins'},
+    'Curve3Pool': {'get_virtual_price'},
+    'FeeDistributor': {'CheckpointToken'},
+    'VeCRV': {'balanceOf', 'balanceOfAt', 'totalSupply', 'totalSupplyAt'},
+    'YBribe': {'RewardAdded', 'RewardClaimed'},
+    'YCRV': {'Mint'},
+    'USDT': {'AddedBlackList', 'RemovedBlackList', 'DestroyedBlackFunds'},
+    'GPv2Settlement': {'Trade', 'Settlement'},
+}
+
+
+def main():
+    full = os.environ.get('ABI_BUNDLE_FULL') == '1'
+    for contract_type, address in CONTRACTS.values():
+        if contract_type not in KEEP:
+            continue
+        abi = [a.dict() for a in Contract(address).contract_type.abi]
+        if not full:
+            abi = [a for a in abi if a.get('name') in KEEP[contract_type]]
+        with open(f'contracts/{contract_type}.json', 'w') as fp:
+            json.dump(abi, fp, separators=(',', ':'))
+        print(f'{contract_type}: {len(abi)} entries')
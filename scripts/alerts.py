@@ -1,11 +1,15 @@
-import json, telebot, os, time
+import json, telebot, os, time, traceback
+STARTED_AT = time.perf_counter()
 from dotenv import load_dotenv, find_dotenv
 from dataclasses import dataclass
 from decimal import Decimal
-from functools import cached_property
+from functools import cached_property, lru_cache
 from typing import List, Optional, Union
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from ape import Contract, chain, project, networks, convert
 from ape.api import ReceiptAPI
+from ape.contracts import ContractInstance
 from ape.types import AddressType, ContractLog
 from ape.utils import ManagerAccessMixin
 from ape_tokens import tokens
@@ -15,17 +19,36 @@ from eth_utils import keccak, humanize_seconds
 from datetime import datetime, timezone
 from sqlalchemy import desc, asc
 # from models import Reports, Event, Transactions, Session, engine, select
+from _logscan import LogScanner
+from _blocks import BlockCache
+from _receipts import ReceiptStore, hash_key
+from _multicall import Multicall
+from _tokens import TokenRegistry
+from _pricing import PriceService
+from _contracts import contract, has_contract
+from _networks import check_network, current
+from _outbox import Outbox
+from _cursors import Cursors
+from _reverts import find_failed
+from _veyfi import LockStates, correlate
+from _metrics import metrics, instrument, tagged, handler_var
+from _tracing import profiled, span
+from _transport import install_telebot, install_web3
 
 load_dotenv(find_dotenv())
 telegram_bot_key = os.environ.get('WAVEY_ALERTS_BOT_KEY')
 alerts_enabled = True if os.environ.get('ENVIRONMENT') == "PROD" else False
-etherscan_base_url = f'https://etherscan.io/'
-bot = telebot.TeleBot(telegram_bot_key)
-oracle = project.ORACLE.at('0x83d95e0D5f402511dB06817Aff3f9eA88224B030')
+network = current()
+etherscan_base_url = network.explorer
 barn_solver = '0x8a4e90e9AFC809a69D2a3BDBE5fff17A12979609'
 prod_solver = '0x398890BE7c4FAC5d766E1AEFFde44B2EE99F38EF'
 trade_handler = '0xb634316E06cC0B358437CbadD4dC94F1D3a92B3b' #'0xcADBA199F3AC26F67f660C89d43eB1820b7f7a3b'
-address_list = [prod_solver, barn_solver]
+address_list = list(network.solvers)
+blocks = BlockCache()
+receipts = ReceiptStore()
+token_registry = TokenRegistry()
+prices = PriceService(token_registry)
+WETH = '0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2'
 
 YFI_LOCKERS = {
     '0xF750162fD81F9a436d74d737EF6eE8FC08e98220': 'StakeDAO',
@@ -44,206 +67,349 @@ SKIP_LIST = [
     '0xB4b9DC1C77bdbb135eA907fd5a08094d98883A35'
 ]
 
+HANDLER_CONCURRENCY = int(os.environ.get('HANDLER_CONCURRENCY', 6))
+# Blocks per checkpoint of the failed txn scan
+REVERT_CHUNK_SIZE = int(os.environ.get('REVERT_CHUNK_SIZE', 1_000))
+# Seconds from import to the first scan before we complain
+COLD_START_BUDGET = float(os.environ.get('COLD_START_BUDGET', 5))
+
+OUTBOX_FLUSH_TIMEOUT = float(os.environ.get('OUTBOX_FLUSH_TIMEOUT', 120))
+# Post a periodic summary of all yCRV pool and mint activity (needs numpy)
+DIGEST_ENABLED = os.environ.get('ALERTS_DIGEST') == '1'
+# Record every emitted alert to the models.Alerts table (run `python models.py` first)
+RECORD_ALERTS = os.environ.get('ALERTS_RECORD') == '1'
+
+@lru_cache(maxsize=None)
+def get_bot():
+    api_url = os.environ.get('TELEGRAM_API_URL') # e.g. a local fake server
+    if api_url:
+        telebot.apihelper.API_URL = api_url.rstrip('/') + '/bot{0}/{1}'
+    install_telebot()
+    return telebot.TeleBot(telegram_bot_key)
+
+def telegram_send(chat_id, msg):
+    with tagged(handler='outbox'), span('send'):
+        get_bot().send_message(chat_id, msg, parse_mode="markdown", disable_web_page_preview = True)
+
+@lru_cache(maxsize=None)
+def get_outbox():
+    return Outbox(telegram_send)
+
+@lru_cache(maxsize=None)
+def get_recorder():
+    from models import AlertRecorder
+    return AlertRecorder(blocks.chain_id)
+
+def send_alert(chat_id, msg):
+    with span('send'):
+        get_outbox().enqueue(chat_id, msg)
+        if RECORD_ALERTS:
+            get_recorder().add(handler_var.get(), chat_id, msg)
+
+# Handlers that add rows to the digest
+DIGEST_HANDLERS = ('alert_ycrv', 'alert_ycrv_swap')
+
+@lru_cache(maxsize=None)
+def get_digest():
+    from _digest import Digest
+    return Digest()
+
+def add_to_digest(rows):
+    if DIGEST_ENABLED:
+        get_digest().add(rows)
+
+def post_digests(cursors):
+    """
+    Sends the digest of every period that ended before the lowest cursor of
+    the digest handlers, so a handler that is behind or failing never has
+    its rows arrive after the period was posted.
+    """
+    if not DIGEST_ENABLED:
+        return
+    done = cursors.start(DIGEST_HANDLERS)
+    if done:
+        get_digest().close(blocks[done - 1].timestamp, send_alert)
+
+def flush_records():
+    if not RECORD_ALERTS:
+        return
+    try:
+        get_recorder().flush()
+    except Exception:
+        # Recording is best effort, it must never hold up alerting
+        print('Failed to record alerts')
+        traceback.print_exc()
+
 def main():
-    with open("local_data.json", "r") as jsonFile:
-        data = json.load(jsonFile)
-        last_block = data['last_block']
-    if not last_block:
-        last_block = 15_000_000
-    print(f'Starting from block number {last_block}')
-    current_block = chain.blocks.height
-    data['last_block'] = current_block
-    alert_veyfi_locks(last_block, current_block)
-    alert_fee_distributor(last_block, current_block)
-    alert_bribes(last_block, current_block)
-    alert_ycrv(last_block, current_block)
-    alert_ycrv_swap(last_block, current_block)
-    usdt_blacklist(last_block, current_block)
-
-    # alert_seasolver(last_block, current_block)
-    # find_reverts(address_list, last_block, current_block)
-
-    data['last_block'] = current_block
-    with open("local_data.json", 'w') as fp:
-        json.dump(data, fp, indent=2)
-
-def alert_veyfi_locks(last_block, current_block):
-    import code
-    deploy_block = 15_974_608
-    veyfi = Contract('0x90c1f9220d90d3966FbeE24045EDd73E1d588aD5')
-    start = max(last_block, deploy_block)
-    logs = list(veyfi.Supply.range(start, current_block))
-    receipts = []
-    for l in logs:
-        txn_hash = l.transaction_hash
-        txn_receipt = networks.provider.get_receipt(txn_hash)
-        if txn_receipt not in receipts:
-            receipts.append(txn_receipt)
-        
-
-    for r in receipts:
-        supply_logs = r.decode_logs([veyfi.Supply])
-        modify_logs = r.decode_logs([veyfi.ModifyLock])
-        withdraw_logs = r.decode_logs([veyfi.Withdraw])
-        for s in supply_logs:
-            block = s.block_number
-            ts = chain.blocks[block].timestamp
-            txn_hash = s.transaction_hash.hex()
-            txn_receipt = networks.provider.get_receipt(txn_hash)
-            idx = 0
-            args = s.dict()['event_arguments']
-            old_supply = args['old_supply']
-            new_supply = args['new_supply']
-            print(old_supply/1e18)
-            print(new_supply/1e18)
-            amount = new_supply - old_supply
-            print("Diff -->",amount/1e18)
-            try:
-                user = list(modify_logs)[idx]['user']
-            except:
-                continue
-            idx += 1
-            if amount == 0:
-                continue
-            elif amount > 0:
-                # New user?
-                new_user = veyfi.balanceOf(user, block_identifier=block-1) == 0
-                locked_end = veyfi.locked(user,block_identifier=block)['end']
-                locked_amount = veyfi.locked(user,block_identifier=block)['amount']/1e18
-                balance = veyfi.balanceOf(user,block_identifier=block)/1e18
-                current_time = chain.blocks[block].timestamp
-                remaining = locked_end - current_time
-                abbr, link, markdown = abbreviate_address(user)
-                msg = f'🔐 *veYFI Deposit Detected!*\n\n'
-                msg += f'Supply increase: {round(amount/1e18,3):,} YFI\n\n'
-                msg += f'User: {markdown} {"🆕" if new_user else ""}\n'
-                msg += f'Balance: {round(balance,3):,} veYFI\n'
-                msg += f'Locked: {round(locked_amount,3):,} YFI\n'
-                msg += f'Lock time remaining: {humanize_seconds(remaining)}'
-                msg += f'\n\n🔗 [View on Etherscan](https://etherscan.io/tx/{txn_hash})'
-                chat_id = CHAT_IDS["WAVEY_ALERTS"]
-                if alerts_enabled:
-                    chat_id = CHAT_IDS["VEYFI"]
-                bot.send_message(chat_id, msg, parse_mode="markdown", disable_web_page_preview = True)                
-
-    logs = list(veyfi.Withdraw.range(start, current_block))
-    for l in logs:
+    check_network(network)
+    install_web3(networks.provider.web3.provider)
+    instrument(networks.provider.web3.provider)
+    cursors = Cursors(default=15_000_000)
+    scanner = build_scanner()
+    cursors.register(cursor_names(scanner))
+    print(f'Starting from block number {cursors.start(cursor_names(scanner))}')
+    get_outbox().start()
+    current_block = blocks.snapshot_head().number
+    startup = time.perf_counter() - STARTED_AT
+    print(f'Startup took {startup:.2f}s{" (over budget)" if startup > COLD_START_BUDGET else ""}')
+    process_window(scanner, cursors, current_block)
+    process_reverts(cursors, current_block)
+    post_digests(cursors)
+
+    pending = get_outbox().flush(OUTBOX_FLUSH_TIMEOUT)
+    if pending:
+        print(f'{pending} alerts left in the outbox for the next run')
+    get_outbox().stop()
+    print(f'RPC calls by handler: {metrics.summary()}')
+    print(f'Time by stage:\n{metrics.stages()}')
+    metrics.write()
+
+def cursor_names(scanner):
+    return [h.__name__ for h in scanner.handlers] + ['find_reverts']
+
+def build_scanner():
+    scanner = LogScanner()
+    for handler, events in watched_events().items():
+        scanner.subscribe(handler, *events)
+    return scanner
+
+def process_window(scanner, cursors, stop):
+    """
+    Runs every handler from its own cursor up to stop, one streamed chunk at
+    a time. Each cursor advances as soon as its handler finishes the chunk,
+    before the next chunk is fetched. The handlers of a chunk run
+    concurrently on up to HANDLER_CONCURRENCY threads. A handler that
+    raises is skipped for the rest of the window and resumes from its last
+    cursor next time.
+    """
+    failed = set()
+    # No handler watches anything on a network without their contracts
+    start = cursors.start((h.__name__ for h in scanner.handlers), default=stop)
+
+    def active(chunk_stop):
+        return [h for h in scanner.handlers if h not in failed and cursors[h.__name__] < chunk_stop]
+
+    with ThreadPoolExecutor(max_workers=HANDLER_CONCURRENCY, thread_name_prefix='handler') as pool, \
+            tagged(handler='scanner'):
+        for chunk_start, chunk_stop, batches in scanner.stream(start, stop, active):
+            futures = {
+                pool.submit(run_handler, handler, logs.since(cursors[handler.__name__])): handler
+                for handler, logs in batches.items()
+            }
+            for future in as_completed(futures):
+                handler = futures[future]
+                name = handler.__name__
+                try:
+                    future.result()
+                except Exception:
+                    print(f'{name} failed on blocks {chunk_start}..{chunk_stop - 1}')
+                    traceback.print_exc()
+                    failed.add(handler)
+                    continue
+                cursors.advance(name, chunk_stop)
+            # Nothing reads a chunk's receipts once its handlers are done
+            receipts.clear()
+            flush_records()
+    return failed
+
+def run_handler(handler, logs):
+    # Whatever a handler does outside the enrich/decode/send spans is rendering
+    with tagged(handler=handler.__name__), profiled(handler.__name__), span('render'):
+        handler(logs)
+
+def watched_events():
+    """The events of every handler whose contracts exist on this network."""
+    subscriptions = {
+        alert_veyfi_locks: ('veyfi', ['ModifyLock', 'Supply', 'Withdraw']),
+        alert_fee_distributor: ('fee_distributor', ['CheckpointToken']),
+        alert_bribes: ('ybribe', ['RewardAdded', 'RewardClaimed']),
+        alert_ycrv: ('ycrv', ['Mint']),
+        alert_ycrv_swap: ('ycrv_pool', ['TokenExchange', 'AddLiquidity', 'RemoveLiquidity']),
+        usdt_blacklist: ('usdt', ['AddedBlackList', 'RemovedBlackList']),
+        alert_seasolver: ('settlement', ['Settlement', 'Trade']),
+    }
+    if not address_list:
+        del subscriptions[alert_seasolver]
+    return {
+        handler: [getattr(contract(name), event) for event in events]
+        for handler, (name, events) in subscriptions.items()
+        if has_contract(name)
+    }
+
+def alert_veyfi_locks(logs):
+    veyfi = contract('veyfi')
+    withdrawals = logs.get(veyfi.Withdraw)
+    deposits = correlate(logs.get(veyfi.ModifyLock) + logs.get(veyfi.Supply))
+
+    states = LockStates(veyfi)
+    deposits = [
+        (d.txn_hash, d.block, d.user, d.amount,
+         states.balance(d.user, d.block - 1), states.locked(d.user, d.block), states.balance(d.user, d.block))
+        for d in deposits
+    ]
+    withdraw_locks = [states.locked(l.event_arguments['user'], l.block_number - 1) for l in withdrawals]
+    states.execute()
+    blocks.prefetch(d[1] for d in deposits)
+
+    for txn_hash, block, user, amount, prior_balance, locked, balance in deposits:
+        # New user?
+        new_user = prior_balance.value == 0
+        locked_end = locked.value['end']
+        locked_amount = locked.value['amount']/1e18
+        balance = balance.value/1e18
+        current_time = blocks[block].timestamp
+        remaining = locked_end - current_time
+        abbr, link, markdown = abbreviate_address(user)
+        msg = f'🔐 *veYFI Deposit Detected!*\n\n'
+        msg += f'Supply increase: {round(amount/1e18,3):,} YFI\n\n'
+        msg += f'User: {markdown} {"🆕" if new_user else ""}\n'
+        msg += f'Balance: {round(balance,3):,} veYFI\n'
+        msg += f'Locked: {round(locked_amount,3):,} YFI\n'
+        msg += f'Lock time remaining: {humanize_seconds(remaining)}'
+        msg += f'\n\n🔗 [View on Etherscan]({etherscan_base_url}tx/{txn_hash})'
+        chat_id = CHAT_IDS["WAVEY_ALERTS"]
+        if alerts_enabled:
+            chat_id = CHAT_IDS["VEYFI"]
+        send_alert(chat_id, msg)
+
+    for l, locked in zip(withdrawals, withdraw_locks):
         txn_hash = l.transaction_hash
         block = l.block_number
-        args = l.dict()['event_arguments']
+        args = l.event_arguments
         amount = args['amount']
         user = args['user']
-        locked_end = veyfi.locked(user,block_identifier=block-1)['end']
-        current_time = chain.blocks.head.timestamp
+        locked_end = locked.value['end']
+        current_time = blocks.head.timestamp
         remaining = max(0, locked_end - current_time) # Before withdraw
-        locked_amount = veyfi.locked(user,block_identifier=block-1)['amount']/1e18
+        locked_amount = locked.value['amount']/1e18
         abbr, link, markdown = abbreviate_address(user)
         msg = f'🪓 *veYFI Withdraw Detected!*\n\n'
         msg += f'User: {markdown}\n'
         msg += f'Amount withdrawn: {round(amount/1e18,2):,} YFI\n'
         msg += f'Penalty: {round(locked_amount-amount/1e18,2):,} YFI\n'
         msg += f'Time remaining: {humanize_seconds(remaining)}'
-        msg += f'\n\n🔗 [View on Etherscan](https://etherscan.io/tx/{txn_hash})'
+        msg += f'\n\n🔗 [View on Etherscan]({etherscan_base_url}tx/{txn_hash})'
         chat_id = CHAT_IDS["WAVEY_ALERTS"]
         if alerts_enabled:
             chat_id = CHAT_IDS["VEYFI"]
-        bot.send_message(chat_id, msg, parse_mode="markdown", disable_web_page_preview = True)
+        send_alert(chat_id, msg)
 
-def alert_ycrv_swap(last_block, current_block):
-    deploy_block = 16_775_458
+def ycrv_chat():
+    return CHAT_IDS["YCRV"] if alerts_enabled else CHAT_IDS["WAVEY_ALERTS"]
+
+def alert_ycrv_swap(logs):
     crv = '0xD533a949740bb3306d119CC777fa900bA034cd52'
     ycrv = '0xFCc5c47bE19d06BF83eB04298b026F81069ff65b'
-    start = max(last_block, deploy_block)
-    pool = Contract('0x99f5aCc8EC2Da2BC0771c32814EFF52b712de1E5')
-    logs = list(pool.TokenExchange.range(start, current_block))
-    for l in logs:
-        args = l.dict()['event_arguments']
+    pool = contract('ycrv_pool')
+    if DIGEST_ENABLED:
+        # Every log goes into the digest, otherwise only large ones read a timestamp
+        blocks.prefetch(logs.block_numbers())
+    digest = []
+    for l in logs.get(pool.TokenExchange):
+        args = l.event_arguments
         block = l.block_number
         txn_hash = l.transaction_hash
-        log_time = chain.blocks[block].timestamp
         sell_token = crv if args['sold_id'] == 0 else ycrv
         buy_token = crv if sell_token == ycrv else ycrv
         amount_sold = args['tokens_sold'] / 1e18
         amount_bought = args['tokens_bought'] / 1e18
+        buying = buy_token == ycrv
+        if DIGEST_ENABLED:
+            digest.append((
+                blocks[block].timestamp, ycrv_chat(), 'swap', 1 if buying else -1,
+                amount_bought if buying else amount_sold, args['buyer'], hash_key(txn_hash), l.log_index,
+            ))
         if amount_sold + amount_bought > 350_000:
-            current_time = chain.blocks.head.timestamp
-            dt = datetime.utcfromtimestamp(log_time).strftime("%m/%d/%Y, %H:%M:%S")
+            current_time = blocks.head.timestamp
+            dt = datetime.utcfromtimestamp(blocks[block].timestamp).strftime("%m/%d/%Y, %H:%M:%S")
             emoji = f"{'📈' if buy_token == ycrv else '📉'}"
             msg = f'{emoji} *New yCRV Swap Detected!*'
-            msg += f'\n\n{amount_sold:,.2f} {Contract(sell_token).symbol()} swapped for'
-            msg += f'\n{amount_bought:,.2f} {Contract(buy_token).symbol()}'
+            msg += f'\n\n{amount_sold:,.2f} {token_registry[sell_token].symbol} swapped for'
+            msg += f'\n{amount_bought:,.2f} {token_registry[buy_token].symbol}'
             msg += f'\n\n{dt}'
-            msg += f'\n\n🔗 [View on Etherscan](https://etherscan.io/tx/{txn_hash})'
+            msg += f'\n\n🔗 [View on Etherscan]({etherscan_base_url}tx/{txn_hash})'
             chat_id = CHAT_IDS["WAVEY_ALERTS"]
             if alerts_enabled:
                 chat_id = CHAT_IDS["YCRV"]
-            bot.send_message(chat_id, msg, parse_mode="markdown", disable_web_page_preview = True)
+            send_alert(chat_id, msg)
 
-    logs = list(pool.AddLiquidity.range(start, current_block))
-    for l in logs:
-        args = l.dict()['event_arguments']
+    for l in logs.get(pool.AddLiquidity):
+        args = l.event_arguments
         block = l.block_number
         txn_hash = l.transaction_hash
-        log_time = chain.blocks[block].timestamp
         amounts = args['token_amounts']
         ycrv_amount = amounts[1]/1e18
         crv_amount = amounts[0]/1e18
+        if DIGEST_ENABLED:
+            digest.append((
+                blocks[block].timestamp, ycrv_chat(), 'lp', 1, crv_amount + ycrv_amount, args['provider'], hash_key(txn_hash), l.log_index,
+            ))
         if ycrv_amount + crv_amount > 350_000:
-            current_time = chain.blocks.head.timestamp
-            dt = datetime.utcfromtimestamp(log_time).strftime("%m/%d/%Y, %H:%M:%S")
+            current_time = blocks.head.timestamp
+            dt = datetime.utcfromtimestamp(blocks[block].timestamp).strftime("%m/%d/%Y, %H:%M:%S")
             emoji = f"{'📈' if crv_amount > ycrv_amount else '📉'}"
             msg = f'{emoji} *New yCRV LP Add Detected!*'
             msg += f'\n\n{crv_amount:,.2f} CRV'
             msg += f'\n{ycrv_amount:,.2f} yCRV'
             msg += f'\n\n{dt}'
-            msg += f'\n\n🔗 [View on Etherscan](https://etherscan.io/tx/{txn_hash})'
+            msg += f'\n\n🔗 [View on Etherscan]({etherscan_base_url}tx/{txn_hash})'
             chat_id = CHAT_IDS["WAVEY_ALERTS"]
             if alerts_enabled:
                 chat_id = CHAT_IDS["YCRV"]
-            bot.send_message(chat_id, msg, parse_mode="markdown", disable_web_page_preview = True)
+            send_alert(chat_id, msg)
 
-    logs = list(pool.RemoveLiquidity.range(start, current_block))
-    for l in logs:
-        args = l.dict()['event_arguments']
+    for l in logs.get(pool.RemoveLiquidity):
+        args = l.event_arguments
         block = l.block_number
         txn_hash = l.transaction_hash
-        log_time = chain.blocks[block].timestamp
         amounts = args['token_amounts']
         ycrv_amount = amounts[1]/1e18
         crv_amount = amounts[0]/1e18
+        if DIGEST_ENABLED:
+            digest.append((
+                blocks[block].timestamp, ycrv_chat(), 'lp', -1, crv_amount + ycrv_amount, args['provider'], hash_key(txn_hash), l.log_index,
+            ))
         if ycrv_amount + crv_amount > 350_000:
-            current_time = chain.blocks.head.timestamp
-            dt = datetime.utcfromtimestamp(log_time).strftime("%m/%d/%Y, %H:%M:%S")
+            current_time = blocks.head.timestamp
+            dt = datetime.utcfromtimestamp(blocks[block].timestamp).strftime("%m/%d/%Y, %H:%M:%S")
             emoji = f"{'📈' if ycrv_amount > crv_amount else '📉'}"
             msg = f'{emoji} *New yCRV LP Removed Detected!*'
             msg += f'\n\n{crv_amount:,.2f} CRV'
             msg += f'\n{ycrv_amount:,.2f} yCRV'
             msg += f'\n\n{dt}'
-            msg += f'\n\n🔗 [View on Etherscan](https://etherscan.io/tx/{txn_hash})'
+            msg += f'\n\n🔗 [View on Etherscan]({etherscan_base_url}tx/{txn_hash})'
             chat_id = CHAT_IDS["WAVEY_ALERTS"]
             if alerts_enabled:
                 chat_id = CHAT_IDS["YCRV"]
-            bot.send_message(chat_id, msg, parse_mode="markdown", disable_web_page_preview = True)
+            send_alert(chat_id, msg)
+    add_to_digest(digest)
 
-def alert_fee_distributor(last_block, current_block):
-    deploy_block = 11_278_886
+def alert_fee_distributor(logs):
     DAY = 60 * 60 * 24
     WEEK = DAY * 7
-    three_crv = Contract('0x6c3F90f043a72FA612cbac8115EE7e52BDe6E490')
-    pool = Contract('0xbEbc44782C7dB0a1A60Cb6fe97d0b483032FF1C7')
-    ve = Contract('0x5f3b5DfEb7B28CDbD7FAba78963EE202a494e2A2')
-    yearn = convert('curve-voter.ychad.eth', AddressType)
-    start = max(last_block, deploy_block)
-    fee_distributor = Contract('0xA464e6DCda8AC41e03616F95f4BC98a13b8922Dc')
-    logs = list(fee_distributor.CheckpointToken.range(start, current_block))
+    pool = contract('three_pool')
+    ve = contract('vecrv')
+    yearn = '0xF147b8125d2ef93FB6965Db97D6746952a133934' # curve-voter.ychad.eth
+    fee_distributor = contract('fee_distributor')
+    logs = logs.get(fee_distributor.CheckpointToken)
+    prices.prefetch_virtual_prices(pool, {l.block_number for l in logs})
+    mc = Multicall()
+    shares = {
+        l.block_number: (
+            mc.add(ve.balanceOfAt, yearn, l.block_number, block=l.block_number),
+            mc.add(ve.totalSupply, block=l.block_number),
+        )
+        for l in logs
+    }
+    mc.execute()
     for l in logs:
-        args = l.dict()['event_arguments']
+        args = l.event_arguments
         block = l.block_number
         txn_hash = l.transaction_hash
         time = args['time']
         amount = args['tokens'] / 1e18
         if amount > 0:
-            current_time = chain.blocks.head.timestamp
+            current_time = blocks.head.timestamp
             next_week_start = int(time / WEEK) * WEEK + WEEK
             if next_week_start < time + DAY:
                 until = time + DAY
@@ -251,100 +417,106 @@ def alert_fee_distributor(last_block, current_block):
                 until = next_week_start
             dt = datetime.utcfromtimestamp(until).strftime("%m/%d/%Y, %H:%M:%S")
             print(f'{txn_hash} | {amount} | claimable at {dt}')
-            amt = round(amount*pool.get_virtual_price()/1e18,2)
+            amt = round(amount*prices.virtual_price(pool, block)/1e18,2)
             msg = f'⚖️ *New veCRV Fees Detected!*'
             msg += f'\n\n*Total Amount*: ${amt:,}'
-            ratio = ve.balanceOfAt(yearn, block) / ve.totalSupply()
+            yearn_balance, total_supply = shares[block]
+            ratio = yearn_balance.value / total_supply.value
             amt = round(amt*ratio,2)
             msg += f'\n\n*Est. Yearn Amount*: ${amt:,}'
             msg += f'\n\n*Claimable At*: {dt}'
-            msg += f'\n\n🔗 [View on Etherscan](https://etherscan.io/tx/{txn_hash})'
+            msg += f'\n\n🔗 [View on Etherscan]({etherscan_base_url}tx/{txn_hash})'
             chat_id = CHAT_IDS["WAVEY_ALERTS"]
             if alerts_enabled:
                 chat_id = CHAT_IDS["YCRV"]
-            bot.send_message(chat_id, msg, parse_mode="markdown", disable_web_page_preview = True)
+            send_alert(chat_id, msg)
 
-def alert_bribes(last_block, current_block):
-    deploy_block = 15_878_262
-    start = max(last_block, deploy_block)
-    ybribe = Contract('0x03dFdBcD4056E2F92251c7B07423E1a33a7D3F6d')
-    logs = list(ybribe.RewardAdded.range(start, current_block))
+def alert_bribes(logs):
+    ybribe = contract('ybribe')
+    voter = '0xF147b8125d2ef93FB6965Db97D6746952a133934'
+    claims = logs.get(ybribe.RewardClaimed, search_topics={'user': voter})
+    logs = logs.get(ybribe.RewardAdded)
+    token_registry.prefetch(
+        [l.event_arguments['reward_token'] for l in logs] +
+        [l.event_arguments['gauge'] for l in logs + claims]
+    )
     for l in logs:
-        args = l.dict()['event_arguments']
+        args = l.event_arguments
         txn_hash = l.transaction_hash
         briber = args['briber']
         gauge = args['gauge']
-        token = Contract(args['reward_token'])
+        token = token_registry[args['reward_token']]
         amount = args['amount']
         if amount == 0:
             continue
         fee = args['fee']
-        gauge_name = ''
         abbr, link, briber_markdown = abbreviate_address(briber)
         abbr, link, gauge_markdown = abbreviate_address(gauge)
-        try:
-            gauge_name = Contract(gauge).name()
-        except:
-            pass
-        amt = round(amount/10**token.decimals(),2)
-        fee = round(fee/10**token.decimals(),2)
+        gauge_name = token_registry[gauge].name or ''
+        decimals = 18 if token.decimals is None else token.decimals
+        amt = round(amount/10**decimals,2)
+        fee = round(fee/10**decimals,2)
         msg = f'🤑 *New Bribe Add Detected!*'
-        msg += f'\n\n*Amount*: {amt:,} {token.symbol()}'
+        msg += f'\n\n*Amount*: {amt:,} {token.symbol}'
         msg += f'\n*Gauge*: {gauge_name} {gauge_markdown}'
         msg += f'\n*Briber*: {briber_markdown}'
-        msg += f'\n*Fee*: {fee:,} {token.symbol()}'
-        msg += f'\n\n🔗 [View on Etherscan](https://etherscan.io/tx/{txn_hash})'
+        msg += f'\n*Fee*: {fee:,} {token.symbol}'
+        msg += f'\n\n🔗 [View on Etherscan]({etherscan_base_url}tx/{txn_hash})'
         chat_id = CHAT_IDS["WAVEY_ALERTS"]
         if alerts_enabled:
             chat_id = CHAT_IDS["YBRIBE"]
-        bot.send_message(chat_id, msg, parse_mode="markdown", disable_web_page_preview = True)
+        send_alert(chat_id, msg)
 
-    voter = '0xF147b8125d2ef93FB6965Db97D6746952a133934'
-    logs = list(ybribe.RewardClaimed.range(start, current_block, search_topics={'user': voter}))
-    for l in logs:
-        args = l.dict()['event_arguments']
+    for l in claims:
+        args = l.event_arguments
         txn_hash = l.transaction_hash
         user = args['user']
         gauge = args['gauge']
         amount = args['amount']
 
-        gauge_name = ''
+        gauge_name = token_registry[gauge].name or ''
         abbr, link, markdown = abbreviate_address(user)
         user = markdown
         abbr, link, markdown = abbreviate_address(gauge)
         gauge = markdown
-        try:
-            gauge_name = Contract(gauge).name()
-        except:
-            pass
         amt = round(amount/10**18,2)
         msg = f'💰 *Bribe Claim Detected!*'
         msg += f'\n\n*Amount*: {amt:,}'# {token.symbol()}'
         msg += f'\n*Gauge*: {gauge_name} {gauge}'
         msg += f'\n*User*: {user}'
-        msg += f'\n\n🔗 [View on Etherscan](https://etherscan.io/tx/{txn_hash})'
+        msg += f'\n\n🔗 [View on Etherscan]({etherscan_base_url}tx/{txn_hash})'
         chat_id = CHAT_IDS["WAVEY_ALERTS"]
         if alerts_enabled:
             chat_id = CHAT_IDS["YBRIBE"]
-        bot.send_message(chat_id, msg, parse_mode="markdown", disable_web_page_preview = True)
+        send_alert(chat_id, msg)
 
-def alert_ycrv(last_block, current_block):
+def alert_ycrv(logs):
     # Config
-    deploy_block = 15_624_808
     alert_size_threshold = 150_000e18
-    start = max(last_block, deploy_block)
-    ycrv = Contract('0xFCc5c47bE19d06BF83eB04298b026F81069ff65b')
-    logs = list(ycrv.Mint.range(start, current_block))
-
+    ycrv = contract('ycrv')
+
+    logs = logs.get(ycrv.Mint)
+    receipts.prefetch_logs(l for l in logs if l.event_arguments['value'] > alert_size_threshold)
+    blocks.prefetch(
+        l.block_number for l in logs if DIGEST_ENABLED or l.event_arguments['value'] > alert_size_threshold
+    )
+    add_to_digest([
+        (
+            blocks[l.block_number].timestamp, ycrv_chat(), 'mint' if l.event_arguments['burned'] else 'lock',
+            1, l.event_arguments['value'] / 1e18, l.event_arguments['minter'],
+            hash_key(l.transaction_hash), l.log_index,
+        )
+        for l in logs
+    ] if DIGEST_ENABLED else [])
     for l in logs:
-        args = l.dict()['event_arguments']
+        args = l.event_arguments
         value = args['value']
         minter = args['minter']
         if value > alert_size_threshold:
             block = l.block_number
-            ts = chain.blocks[block].timestamp
+            ts = blocks[block].timestamp
             txn_hash = l.transaction_hash
-            txn_receipt = networks.provider.get_receipt(txn_hash)
+            txn_receipt = receipts[txn_hash]
             receiver = txn_receipt.transaction.sender # args['receiver'] <--- this method gets 
             dt = datetime.utcfromtimestamp(ts).strftime("%m/%d/%Y, %H:%M:%S")
             abbr, link, markdown = abbreviate_address(receiver)
@@ -356,59 +528,72 @@ def alert_ycrv(last_block, current_block):
                 msg += f'{amt:,} yveCRV migrated'
             else:
                 msg += f'{amt:,} CRV locked'
-            msg += f'\n\n🔗 [Etherscan](https://etherscan.io/tx/{txn_hash})'
+            msg += f'\n\n🔗 [Etherscan]({etherscan_base_url}tx/{txn_hash})'
 
             chat_id = CHAT_IDS["WAVEY_ALERTS"]
             if alerts_enabled:
                 chat_id = CHAT_IDS["YCRV"]
-            bot.send_message(chat_id, msg, parse_mode="markdown", disable_web_page_preview = True)
+            send_alert(chat_id, msg)
 
-def alert_seasolver(last_block, current_block):
+def alert_seasolver(logs):
     barn_solver = '0x8a4e90e9AFC809a69D2a3BDBE5fff17A12979609'
     prod_solver = '0x398890BE7c4FAC5d766E1AEFFde44B2EE99F38EF'
-    settlement = Contract('0x9008d19f58aabd9ed0d60971565aa8510560ab41')
-
-    # Config
-    deploy_block = 15_624_808
-    start = max(last_block, deploy_block)
-
-    prod_logs = list(settlement.Settlement.range(start, current_block, search_topics={'solver': prod_solver}))
-    barn_logs = list(settlement.Settlement.range(start, current_block, search_topics={'solver': barn_solver}))
-    logs = prod_logs + barn_logs
-    for l in logs:
-        txn_hash = l.transaction_hash
-        solver = l.dict()['event_arguments']['solver']
+    settlement = contract('settlement')
+
+    prod_logs = logs.get(settlement.Settlement, search_topics={'solver': prod_solver})
+    barn_logs = logs.get(settlement.Settlement, search_topics={'solver': barn_solver})
+    settlements = prod_logs + barn_logs
+    if not settlements:
+        return
+    trade_logs = defaultdict(list)
+    for l in logs.get(settlement.Trade):
+        trade_logs[hash_key(l.transaction_hash)].append(l)
+    receipts.prefetch_logs(settlements)
+    blocks.prefetch(l.block_number for l in settlements)
+    prices.prefetch_prices((WETH, l.block_number) for l in settlements)
+    token_registry.prefetch(
+        t.event_arguments[k] for l in settlements for t in trade_logs[hash_key(l.transaction_hash)]
+        for k in ('sellToken', 'buyToken')
+    )
+
+    mc = Multicall()
+    solves = []
+    for l in settlements:
+        trades = enumerate_trades(trade_logs[hash_key(l.transaction_hash)])
+        if not trades:
+            continue
+        solves.append((l, trades, calculate_slippage(trades, l.block_number, mc)))
+    mc.execute()
+    for l, trades, slippage in solves:
+        txn_hash = hash_key(l.transaction_hash)
+        solver = l.event_arguments['solver']
         block = l.block_number
-        trades = enumerate_trades(block, txn_hash)
-        slippage = calculate_slippage(trades, block)
+        slippage = {token: after.value - before.value for token, (before, after) in slippage.items()}
         format_solver_alert(solver, txn_hash, block, trades, slippage)
 
-def usdt_blacklist(last_block, current_block):
-    start = last_block
-    usdt = Contract('0xdAC17F958D2ee523a2206206994597C13D831ec7')
-    destroyed_funds = list(usdt.DestroyedBlackFunds.range(start, current_block))
-    adds = list(usdt.AddedBlackList.range(start, current_block))
-    removals = list(usdt.RemovedBlackList.range(start, current_block))
+def usdt_blacklist(logs):
+    usdt = contract('usdt')
+    adds = logs.get(usdt.AddedBlackList)
+    removals = logs.get(usdt.RemovedBlackList)
     logs = adds + removals
+    blocks.prefetch(l.block_number for l in logs)
     for l in logs:
         txn_hash = l.transaction_hash
         block = l.block_number
-        user = l.dict()['event_arguments']['_user']
-        ts = chain.blocks[block].timestamp
-        txn_receipt = networks.provider.get_receipt(txn_hash)
-        receiver = txn_receipt.transaction.sender # args['receiver'] <--- this method gets 
+        user = l.event_arguments['_user']
+        ts = blocks[block].timestamp
         dt = datetime.utcfromtimestamp(ts).strftime("%m/%d/%Y, %H:%M:%S")
         abbr, link, markdown = abbreviate_address(user)
-        added = True if l.dict()['event_name'] == 'AddedBlackList' else False
+        added = l.event_name == 'AddedBlackList'
         msg = f'🏴‍☠️ *USDT Blacklist Updated!*\n\n'
         msg += f'{"Added" if added else "Removed"} User: {markdown}'
-        msg += f'\n\n🔗 [Etherscan](https://etherscan.io/tx/{txn_hash})'
+        msg += f'\n\n🔗 [Etherscan]({etherscan_base_url}tx/{txn_hash})'
         chat_id = CHAT_IDS["WAVEY_ALERTS"]
-        bot.send_message(chat_id, msg, parse_mode="markdown", disable_web_page_preview = True)
+        send_alert(chat_id, msg)
 
 
-def calculate_slippage(trades, block):
-
+def calculate_slippage(trades, block, mc):
+    # Queues the trade handler balance reads on mc, values are read after mc.execute()
     slippages = {}
     for trade in trades:
         buy_token_address = trade['buy_token_address']
@@ -422,59 +607,28 @@ def calculate_slippage(trades, block):
         if buy_token_address in slippages:
             continue
 
-        buy_token = project.ERC20.at(buy_token_address)
-        before = buy_token.balanceOf(trade_handler, block_identifier=block-1)
-        after = buy_token.balanceOf(trade_handler, block_identifier=block+1)
-        slippages[buy_token_address] = after - before
+        buy_token = erc20(buy_token_address)
+        before = mc.add(buy_token.balanceOf, trade_handler, block=block-1)
+        after = mc.add(buy_token.balanceOf, trade_handler, block=block+1)
+        slippages[buy_token_address] = (before, after)
 
     return slippages
 
 
-def enumerate_trades(block, txn_hash):
-    settlement = Contract('0x9008d19f58aabd9ed0d60971565aa8510560ab41')
-    logs = list(settlement.Trade.range(block-1, block+1))
+def enumerate_trades(logs):
     trades = []
     for l in logs:
-        if l.transaction_hash != txn_hash:
-            continue
-        args = l.dict()['event_arguments']
-        eth = '0xEeeeeEeeeEeEeeEeEeEeeEEEeeeeEeeeeeeeEEeE'
-        try:
-            sell_token = args['sellToken']
-            if sell_token == eth:
-                sell_token_symbol = 'ETH'
-                sell_token_decimals = 18
-            else:
-                sell_token_symbol = project.ERC20.at(sell_token).symbol()
-                sell_token_decimals = project.ERC20.at(sell_token).decimals()
-        except:
-            sell_token_symbol = '? Cannot Find ?'
-            if sell_token == '0x9f8F72aA9304c8B593d555F12eF6589cC3A579A2':
-                sell_token_symbol = 'MKR'
-            sell_token_decimals = 18
-
-        try:
-            buy_token = args['buyToken']
-            if buy_token == eth:
-                buy_token_symbol = 'ETH'
-                buy_token_decimals = 18
-            else:
-                buy_token_symbol = project.ERC20.at(buy_token).symbol()
-                buy_token_decimals = project.ERC20.at(buy_token).decimals()
-        except:
-            buy_token_symbol = '? Cannot Find ?'
-            if buy_token == '0x9f8F72aA9304c8B593d555F12eF6589cC3A579A2':
-                buy_token_symbol = 'MKR'
-            buy_token_decimals = 18
-
+        args = l.event_arguments
+        sell_token = token_registry[args['sellToken']]
+        buy_token = token_registry[args['buyToken']]
         trade = {
             'owner': args['owner'],
             'sell_token_address': args['sellToken'],
-            'sell_token_symbol': sell_token_symbol,
-            'sell_token_decimals': sell_token_decimals,
+            'sell_token_symbol': sell_token.symbol or '? Cannot Find ?',
+            'sell_token_decimals': 18 if sell_token.decimals is None else sell_token.decimals,
             'buy_token_address': args['buyToken'],
-            'buy_token_symbol': buy_token_symbol,
-            'buy_token_decimals': buy_token_decimals,
+            'buy_token_symbol': buy_token.symbol or '? Cannot Find ?',
+            'buy_token_decimals': 18 if buy_token.decimals is None else buy_token.decimals,
             'sell_amount': args['sellAmount'],
             'buy_amount': args['buyAmount'],
             'fee_amount': args['feeAmount'],
@@ -493,10 +647,9 @@ def format_solver_alert(solver, txn_hash, block, trade_data, slippages):
     barn_solver = '0x8a4e90e9AFC809a69D2a3BDBE5fff17A12979609'
     if solver == barn_solver:
         tonkers_base_url = f'https://barn.seasolver.dev/route/'
-    txn_receipt = networks.provider.get_receipt(txn_hash)
-    ts = chain.blocks[block].timestamp
+    txn_receipt = receipts[txn_hash]
+    ts = blocks[block].timestamp
     index = get_index_in_block(txn_hash)
-    index = index if index != 1_000_000 else "???"
 
     dt = datetime.utcfromtimestamp(ts).strftime("%m/%d %H:%M")
     msg = f'{"🧜‍♂️" if solver == prod_solver else "🐓"} *New solve detected!*\n'
@@ -513,15 +666,13 @@ def format_solver_alert(solver, txn_hash, block, trade_data, slippages):
         msg += f'    [{t["sell_token_symbol"]}]({etherscan_base_url}token/{t["sell_token_address"]}) {sell_amt:,} -> [{t["buy_token_symbol"]}]({etherscan_base_url}token/{t["buy_token_address"]}) {buy_amt:,} | [{user[0:7]}...]({etherscan_base_url}address/{user})\n'
 
     msg += "\n✂️ *Slippages*"
+    token_registry.prefetch(slippages)
     for key in slippages:
-        token = project.ERC20.at(key)
+        token = token_registry[key]
         slippage = slippages[key]
         color = "🔴" if slippage < 0 else "🟢"
-        amount = round(slippage/10**token.decimals(),4)
-        try:
-            msg += f"\n   {color} {token.symbol()}: {amount}"
-        except:
-            msg += f"\n   {color} -SymbolError-: {amount}"
+        amount = round(slippage/10**(18 if token.decimals is None else token.decimals),4)
+        msg += f"\n   {color} {token.symbol or '-SymbolError-'}: {amount}"
     msg += f'\n\n{calc_gas_cost(txn_receipt)}'
     msg += f'\n\n🔗 [Etherscan]({etherscan_base_url}tx/{txn_hash}) | [Cow]({cow_explorer_url}) | [Eigen]({eigen_url}) | [EthTx]({ethtx_explorer_url})'
 
@@ -532,10 +683,14 @@ def format_solver_alert(solver, txn_hash, block, trade_data, slippages):
         # chat_id = CHAT_IDS["GNOSIS_CHAIN_POC"]
     else:
         chat_id = CHAT_IDS["WAVEY_ALERTS"]
-    bot.send_message(chat_id, msg, parse_mode="markdown", disable_web_page_preview = True)
+    send_alert(chat_id, msg)
+
+def erc20(address):
+    # Built from the bundled ABI, no code lookup or explorer round trip
+    return ContractInstance(address, project.ERC20.contract_type)
 
 def abbreviate_address(address):
-    link = f'https://etherscan.io/address/{address}'
+    link = f'{etherscan_base_url}address/{address}'
     if address in YFI_LOCKERS:
         abbr = YFI_LOCKERS[address]
         markdown = f'[{abbr}]({link})'
@@ -545,37 +700,50 @@ def abbreviate_address(address):
     return abbr, link, markdown
 
 def find_reverts(address_list, start_block, end_block):
-    for b in range(start_block, end_block):
-        block = chain.blocks[b]
-        for t in block.transactions:
-            if t.dict()['from'] in address_list:
-                txn_hash = t.txn_hash.hex()
-                txn_receipt = networks.provider.get_receipt(txn_hash)
-                failed = txn_receipt.failed
-                if not failed:
-                    continue
-                msg = f'*🤬  Failed Transaction detected!*\n\n'
-                f= t.dict()['from']
-                e = "🧜‍♂️" if f == address_list[0] else "🐓"
-                abbr, link, markdown = abbreviate_address(f)
-                msg += f'Sent from {markdown} {e}\n\n'
-                msg += f'{calc_gas_cost(txn_receipt)}'
-                msg += f'\n\n🔗 [Etherscan]({etherscan_base_url}tx/{txn_hash}) | [Tenderly](https://dashboard.tenderly.co/tx/mainnet/{txn_hash})'
-                if alerts_enabled:
-                    chat_id = CHAT_IDS["GNOSIS_CHAIN_POC"]
-                else:
-                    chat_id = CHAT_IDS["WAVEY_ALERTS"]
-                bot.send_message(chat_id, msg, parse_mode="markdown", disable_web_page_preview = True)
+    senders = {a.lower(): a for a in address_list}
+    failed = find_failed(receipts, senders, start_block, end_block)
+    prices.prefetch_prices((WETH, receipts[txn_hash].block_number) for txn_hash, _ in failed)
+    for txn_hash, sender in failed:
+        txn_receipt = receipts[txn_hash]
+        msg = f'*🤬  Failed Transaction detected!*\n\n'
+        f = senders[sender]
+        e = "🧜‍♂️" if f == address_list[0] else "🐓"
+        abbr, link, markdown = abbreviate_address(f)
+        msg += f'Sent from {markdown} {e}\n\n'
+        msg += f'{calc_gas_cost(txn_receipt)}'
+        msg += f'\n\n🔗 [Etherscan]({etherscan_base_url}tx/{txn_hash}) | [Tenderly](https://dashboard.tenderly.co/tx/{network.tenderly}/{txn_hash})'
+        if alerts_enabled:
+            chat_id = CHAT_IDS["GNOSIS_CHAIN_POC"]
+        else:
+            chat_id = CHAT_IDS["WAVEY_ALERTS"]
+        send_alert(chat_id, msg)
+
+def process_reverts(cursors, stop):
+    """Scans for solver reverts up to stop, returns True if a chunk failed."""
+    if not address_list:
+        cursors.advance('find_reverts', stop)
+        return False
+    start = cursors['find_reverts']
+    for chunk_start in range(start, stop, REVERT_CHUNK_SIZE):
+        chunk_stop = min(chunk_start + REVERT_CHUNK_SIZE, stop)
+        try:
+            with tagged(handler='find_reverts', stage='reverts'):
+                find_reverts(address_list, chunk_start, chunk_stop)
+        except Exception:
+            print(f'find_reverts failed on blocks {chunk_start}..{chunk_stop - 1}')
+            traceback.print_exc()
+            return True
+        receipts.clear()
+        cursors.advance('find_reverts', chunk_stop)
+    return False
 
 def calc_gas_cost(txn_receipt):
     eth_used = txn_receipt.gas_price * txn_receipt.gas_used
-    gas_cost = oracle.getNormalizedValueUsdc('0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2', eth_used) / 10**6
+    gas_cost = prices.value_usd(WETH, eth_used, txn_receipt.block_number)
+    if gas_cost is None:
+        return f'💸 {round(eth_used/1e18,4)} ETH'
     return f'💸 ${round(gas_cost,2):,} | {round(eth_used/1e18,4)} ETH'
 
 def get_index_in_block(txn_hash):
-    tx = chain.provider.get_receipt(txn_hash)
-    hashes = [x.txn_hash.hex() for x in chain.blocks[tx.block_number].transactions]
-    try:
-        return hashes.index(tx.txn_hash)
-    except:
-        return 1_000_000 # Not found
\ No newline at end of file
+    index = receipts.get_raw(txn_hash).get('transactionIndex')
+    return "???" if index is None else index
@@ -0,0 +1,126 @@
+import json, os, tempfile, time, tracemalloc
+from ape import networks
+from _replay import Fixtures, ReplayServer, FakeTelegram
+
+# Replays each handler over windows ending at a fixed block against recorded
+# JSON-RPC responses, so runs are comparable and need no network. Fixtures
+# are large and not committed, record them once per checkout:
+#
+#   BENCH_UPSTREAM_RPC=https://... ape run benchmark   # required once: record fixtures
+#   ape run benchmark                                  # replay offline
+#   BENCH_OUTPUT=bench_fixtures/baseline.json ape run benchmark   # keep a baseline to compare against
+FIXTURES = os.environ.get('BENCH_FIXTURES', 'bench_fixtures/mainnet.json')
+UPSTREAM = os.environ.get('BENCH_UPSTREAM_RPC')
+WINDOWS = [int(w) for w in os.environ.get('BENCH_WINDOWS', '100,1000,10000').split(',')]
+HANDLERS = [h for h in os.environ.get('BENCH_HANDLERS', '').split(',') if h]
+OUTPUT = os.environ.get('BENCH_OUTPUT')
+# Blocks this close to the head can still be reorged, record behind them
+RECORD_DEPTH = 64
+
+os.environ.setdefault('WAVEY_ALERTS_BOT_KEY', '0:offline')
+# Fixtures are mainnet, whatever network ape started on before main() switches
+os.environ.setdefault('ALERTS_NETWORK', 'ethereum')
+import alerts, _cache
+from _blocks import BlockCache
+from _cursors import Cursors
+from _logscan import LogScanner
+from _pricing import PriceService
+from _receipts import ReceiptStore
+from _tokens import TokenRegistry
+
+
+def missing_fixtures():
+    return (
+        f'{FIXTURES} has no recording. Record it once against an archive node with '
+        f'BENCH_UPSTREAM_RPC=https://... ape run benchmark, later runs replay it offline'
+    )
+
+
+def end_block(fixtures):
+    if 'end_block' not in fixtures.meta:
+        if os.environ.get('BENCH_END_BLOCK'):
+            fixtures.meta['end_block'] = int(os.environ['BENCH_END_BLOCK'])
+        elif fixtures.upstream:
+            fixtures.meta['end_block'] = alerts.blocks.snapshot_head().number - RECORD_DEPTH
+        else:
+            raise SystemExit(missing_fixtures())
+        fixtures.dirty = True
+    return fixtures.meta['end_block']
+
+
+def reset_state(workdir):
+    # Every run starts cold: fresh in-memory caches and an empty SQLite cache
+    _cache.CACHE_DIR = workdir
+    alerts.blocks = BlockCache()
+    alerts.receipts = ReceiptStore()
+    alerts.token_registry = TokenRegistry()
+    alerts.prices = PriceService(alerts.token_registry)
+
+
+def run(handler, events, start, stop, rpc, telegram):
+    scanner = LogScanner()
+    scanner.subscribe(handler, *events)
+    with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+        reset_state(workdir)
+        cursors = Cursors(os.path.join(workdir, 'cursors.json'), default=start)
+        sent = telegram.sent
+        rpc.stats.reset()
+        tracemalloc.start()
+        started = time.perf_counter()
+        failed = alerts.process_window(scanner, cursors, stop)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return {
+        'handler': handler.__name__,
+        'window': stop - start,
+        'wall_time': elapsed,
+        'peak_memory': peak,
+        'alerts': telegram.sent - sent,
+        'failed': bool(failed),
+        **rpc.stats.snapshot(),
+    }
+
+
+def report(results):
+    print(f'\n{"handler":<24}{"window":>8}{"wall s":>9}{"peak MiB":>10}{"http":>7}{"calls":>7}{"alerts":>8}{"misses":>8}')
+    for r in results:
+        print(
+            f'{r["handler"]:<24}{r["window"]:>8}{r["wall_time"]:>9.2f}{r["peak_memory"] / 2**20:>10.1f}'
+            f'{r["requests"]:>7}{sum(r["calls"].values()):>7}{r["alerts"]:>8}{sum(r["misses"].values()):>8}'
+            f'{"  FAILED" if r["failed"] else ""}'
+        )
+    print('\nRPC calls by method:')
+    for r in results:
+        calls = ', '.join(f'{m}={n}' for m, n in sorted(r['calls'].items(), key=lambda i: -i[1]))
+        print(f'  {r["handler"]} @ {r["window"]}: {calls}')
+    if any(r['misses'] for r in results):
+        print('\nSome calls were missing from the fixtures, re-record with BENCH_UPSTREAM_RPC')
+
+
+def main():
+    fixtures = Fixtures(FIXTURES, UPSTREAM)
+    if not fixtures.responses and not UPSTREAM:
+        raise SystemExit(missing_fixtures())
+    rpc = ReplayServer(fixtures)
+    telegram = FakeTelegram()
+    os.environ['TELEGRAM_API_URL'] = telegram.uri
+    # Straight to the fake Telegram, the outbox rate limits would dominate
+    alerts.send_alert = alerts.telegram_send
+    results = []
+    try:
+        with networks.parse_network_choice(f'ethereum:mainnet:{rpc.uri}'):
+            stop = end_block(fixtures)
+            for handler, events in alerts.watched_events().items():
+                if HANDLERS and handler.__name__ not in HANDLERS:
+                    continue
+                for window in WINDOWS:
+                    results.append(run(handler, events, stop - window, stop, rpc, telegram))
+    finally:
+        fixtures.save()
+        rpc.close()
+        telegram.close()
+    report(results)
+    if OUTPUT:
+        with open(OUTPUT, 'w') as fp:
+            json.dump({'end_block': fixtures.meta['end_block'], 'results': results}, fp, indent=2)
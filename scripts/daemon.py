@@ -0,0 +1,59 @@
+import os, time, traceback
+from ape import networks
+from alerts import (
+    blocks, build_scanner, cursor_names, get_outbox, network, post_digests, process_reverts, process_window,
+)
+from _cursors import Cursors
+from _networks import check_network
+from _metrics import instrument, metrics, serve
+from _transport import install_web3
+
+POLL_INTERVAL = float(os.environ.get('DAEMON_POLL_INTERVAL', 4))
+# Blocks processed per step when catching up
+MAX_BATCH = int(os.environ.get('DAEMON_MAX_BATCH', 100))
+# Stay this many blocks behind the head to avoid alerting on reorged logs
+CONFIRMATIONS = int(os.environ.get('DAEMON_CONFIRMATIONS', 0))
+RETRY_DELAY = float(os.environ.get('DAEMON_RETRY_DELAY', 15))
+
+
+def main():
+    check_network(network)
+    install_web3(networks.provider.web3.provider)
+    instrument(networks.provider.web3.provider)
+    serve()
+    cursors = Cursors(default=blocks.snapshot_head().number)
+    scanner = build_scanner()
+    names = cursor_names(scanner)
+    cursors.register(names)
+    print(f'Following new blocks from {cursors.start(names)}')
+    get_outbox().start()
+    # Handlers that failed last step. The step is sized from the others, so
+    # a handler stuck on one bad log never holds the rest back; it is retried
+    # every step from its own cursor.
+    lagging = set()
+    while True:
+        try:
+            start = cursors.start([n for n in names if n not in lagging] or names)
+            head = blocks.snapshot_head().number
+            stop = min(head + 1 - CONFIRMATIONS, start + MAX_BATCH)
+            if stop <= start:
+                time.sleep(POLL_INTERVAL)
+                continue
+            started = time.perf_counter()
+            failed = {h.__name__ for h in process_window(scanner, cursors, stop)}
+            if process_reverts(cursors, stop):
+                failed.add('find_reverts')
+            post_digests(cursors)
+            print(f'Processed blocks {start}..{stop - 1} in {time.perf_counter() - started:.2f}s')
+            metrics.write()
+            lagging = failed
+            if failed:
+                time.sleep(RETRY_DELAY)
+        except KeyboardInterrupt:
+            print(f'Stopping at block {cursors.start(names)}')
+            get_outbox().flush(timeout=10)
+            get_outbox().stop()
+            return
+        except Exception:
+            traceback.print_exc()
+            time.sleep(RETRY_DELAY)
@@ -0,0 +1,11 @@
+import multiprocessing, os
+from _networks import parse_networks, supervise
+
+# ALERTS_NETWORKS=ethereum ape run multichain, see _networks.NETWORKS
+# Local dev chains: ALERTS_NETWORKS=a=ethereum:local:http://127.0.0.1:8545,b=ethereum:local:http://127.0.0.1:8546
+
+
+def main():
+    selected = parse_networks(os.environ.get('ALERTS_NETWORKS', 'ethereum'))
+    # spawn: every network process imports ape and the alert modules afresh
+    supervise(selected, multiprocessing.get_context('spawn'))
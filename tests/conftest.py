@@ -0,0 +1,4 @@
+import os, sys
+
+# The alert modules import each other by bare name, as ape runs them from scripts/
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
@@ -0,0 +1,31 @@
+import json
+from _cursors import Cursors
+
+
+def test_last_block_waits_for_handler_without_cursor(tmp_path):
+    path = tmp_path / 'local_data.json'
+    path.write_text(json.dumps({'last_block': 100}))
+    cursors = Cursors(str(path))
+    cursors.register(['a', 'b', 'find_reverts'])
+    cursors.advance('b', 5100)  # 'a' failed before its first chunk
+
+    reloaded = Cursors(str(path))
+    assert reloaded['a'] == 100
+    assert reloaded['find_reverts'] == 100
+    assert reloaded['b'] == 5100
+    assert json.loads(path.read_text())['last_block'] == 100
+
+
+def test_last_block_ignores_unregistered_handlers(tmp_path):
+    path = tmp_path / 'local_data.json'
+    path.write_text(json.dumps({'last_block': 100, 'cursors': {'removed': 50}}))
+    cursors = Cursors(str(path))
+    cursors.register(['a'])
+    cursors.advance('a', 200)
+    assert json.loads(path.read_text())['last_block'] == 200
+
+
+
+def test_start_without_handlers(tmp_path):
+    cursors = Cursors(str(tmp_path / 'local_data.json'), default=100)
+    assert cursors.start([], default=300) == 300
@@ -0,0 +1,45 @@
+import importlib, sys
+from types import SimpleNamespace
+import pytest
+from _networks import NETWORKS, check_network, current
+
+
+def connect(monkeypatch, chain_id):
+    # current() and check_network() only read the chain id of ape's provider
+    provider = SimpleNamespace(chain_id=chain_id)
+    monkeypatch.setitem(sys.modules, 'ape', SimpleNamespace(
+        networks=SimpleNamespace(active_provider=provider, provider=provider),
+    ))
+    monkeypatch.delenv('ALERTS_NETWORK', raising=False)
+
+
+@pytest.mark.parametrize('chain_id', [1, 1337, 31337, 424242])
+def test_current_never_fails(monkeypatch, chain_id):
+    connect(monkeypatch, chain_id)
+    assert current() == NETWORKS['ethereum']
+
+
+def test_check_network_allows_dev_chains(monkeypatch):
+    connect(monkeypatch, 31337)
+    check_network(current())
+
+
+def test_check_network_rejects_unknown_chain(monkeypatch):
+    connect(monkeypatch, 424242)
+    with pytest.raises(RuntimeError, match='chain id 424242'):
+        check_network(current())
+
+
+@pytest.mark.parametrize('chain_id', [1337, 424242])
+def test_alerts_imports_on_any_chain(monkeypatch, chain_id):
+    for dependency in ('ape', 'ape_tokens', 'telebot', 'sqlmodel'):
+        pytest.importorskip(dependency)
+    from ape import networks
+    monkeypatch.setattr(
+        type(networks), 'active_provider', property(lambda self: SimpleNamespace(chain_id=chain_id)),
+    )
+    monkeypatch.delenv('ALERTS_NETWORK', raising=False)
+    for name in ('alerts', '_contracts'):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    alerts = importlib.import_module('alerts')
+    assert alerts.network == NETWORKS['ethereum']
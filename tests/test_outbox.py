@@ -0,0 +1,20 @@
+import time
+from _outbox import Outbox
+
+
+def test_backing_off_message_holds_its_chat(tmp_path):
+    outbox = Outbox(lambda chat_id, text: None, str(tmp_path / 'outbox.sqlite'))
+    outbox.enqueue(1, 'first')
+    outbox.enqueue(1, 'second')
+    outbox.enqueue(2, 'other chat')
+    now = time.time()
+    outbox.db.execute("UPDATE outbox SET next_attempt = ? WHERE text = 'first'", [now + 60])
+    assert [text for _, _, text, _ in outbox._due(now)] == ['other chat']
+
+
+def test_prune_drops_old_failed_messages(tmp_path):
+    outbox = Outbox(lambda chat_id, text: None, str(tmp_path / 'outbox.sqlite'))
+    outbox.enqueue(1, 'pending')
+    outbox.db.execute("INSERT INTO outbox (chat_id, text, created, failed) VALUES ('1', 'dropped', 0, 1)")
+    outbox.prune()
+    assert outbox.db.execute('SELECT text FROM outbox').fetchall() == [('pending',)]
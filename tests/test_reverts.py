@@ -0,0 +1,25 @@
+import pytest
+
+pytest.importorskip('ape')
+import _reverts
+from _rpc import RPCError
+
+SENDER = '0x398890be7c4fac5d766e1aeffde44b2ee99f38ef'
+
+
+def block(number, *senders):
+    return {
+        'number': hex(number),
+        'transactions': [{'hash': f'0x{number:x}{i}', 'from': s} for i, s in enumerate(senders)],
+    }
+
+
+def test_matches_senders(monkeypatch):
+    monkeypatch.setattr(_reverts, 'batch_request', lambda calls, coalesce: [block(10, SENDER), block(11, '0xother')])
+    assert _reverts.sent_in_range({SENDER}, 10, 12) == [('0xa0', 10, SENDER)]
+
+
+def test_missing_block_keeps_the_chunk(monkeypatch):
+    monkeypatch.setattr(_reverts, 'batch_request', lambda calls, coalesce: [block(10), None, block(12, SENDER)])
+    with pytest.raises(RPCError, match='block 11'):
+        _reverts.sent_in_range({SENDER}, 10, 13)
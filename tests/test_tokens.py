@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip('ape')
+import _cache, _tokens
+from _multicall import CallFailed, reverted
+from _rpc import RPCError
+
+TOKEN = '0x0000000000000000000000000000000000000001'
+
+
+class FakeCall:
+    def __init__(self, result):
+        self.result = result
+        self.error = result if isinstance(result, RPCError) else None
+        self.success = self.error is None
+        self.returndata = None
+
+    @property
+    def transient(self):
+        return self.error is not None and not reverted(self.error)
+
+    @property
+    def value(self):
+        if not self.success:
+            raise CallFailed(str(self.error))
+        return self.result
+
+    def get(self, default=None):
+        return self.result if self.success else default
+
+
+def registry(monkeypatch, tmp_path, answers):
+    """A TokenRegistry whose Multicall answers each prefetch with the next of `answers`."""
+    answers = iter(answers)
+
+    class FakeMulticall:
+        def __init__(self):
+            self.calls = []
+
+        def add(self, method):
+            self.calls.append(method)
+            return method
+
+        def execute(self):
+            for call, result in zip(self.calls, next(answers)):
+                call.__init__(result)
+
+    monkeypatch.setattr(_cache, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(_tokens, 'Multicall', FakeMulticall)
+    monkeypatch.setattr(_tokens, 'project', SimpleNamespace(ERC20=SimpleNamespace(contract_type=None)))
+    monkeypatch.setattr(_tokens, 'ContractInstance', lambda address, contract_type: SimpleNamespace(
+        symbol=FakeCall(None), decimals=FakeCall(None), name=FakeCall(None),
+    ))
+    tokens = _tokens.TokenRegistry()
+    tokens._chain_id = 1
+    return tokens
+
+
+def test_transient_failure_is_retried(monkeypatch, tmp_path):
+    timeout = RPCError('eth_call: 429 Too Many Requests')
+    tokens = registry(monkeypatch, tmp_path, [(timeout, timeout, timeout), ('YFI', 18, 'yearn.finance')])
+    assert tokens[TOKEN].decimals is None
+    assert TOKEN not in tokens.failed
+    assert tokens.db.execute('SELECT COUNT(*) FROM tokens').fetchone()[0] == 0
+
+    monkeypatch.setattr(_tokens, 'TOKEN_TRANSIENT_RETRY', -1)
+    assert tokens[TOKEN] == _tokens.Token(TOKEN, 'YFI', 18, 'yearn.finance')
+
+
+def test_revert_is_cached_as_failure(monkeypatch, tmp_path):
+    revert = RPCError('eth_call: execution reverted')
+    tokens = registry(monkeypatch, tmp_path, [(revert, revert, revert)])
+    assert not tokens[TOKEN].ok
+    assert TOKEN in tokens.failed
+    assert not tokens._stale(TOKEN)
@@ -0,0 +1,28 @@
+import json
+from types import SimpleNamespace
+import pytest
+
+web3 = pytest.importorskip('web3')
+pytest.importorskip('requests')
+import _transport
+
+
+def test_web3_requests_use_the_pooled_session(monkeypatch):
+    sent = []
+
+    def post(uri, data, headers, timeout):
+        request = json.loads(data)
+        sent.append((uri, request['method'], timeout))
+        body = {'jsonrpc': '2.0', 'id': request['id'], 'result': '0x1'}
+        return SimpleNamespace(content=json.dumps(body).encode(), raise_for_status=lambda: None)
+
+    monkeypatch.setattr(_transport.rpc_session(), 'post', post)
+    provider = web3.HTTPProvider('http://127.0.0.1:8545')
+    w3 = web3.Web3(provider)
+    _transport.install_web3(provider)
+    _transport.install_web3(provider)  # a second install must not wrap twice
+
+    assert w3.eth.chain_id == 1
+    assert sent == [(
+        'http://127.0.0.1:8545', 'eth_chainId', (_transport.RPC_CONNECT_TIMEOUT, _transport.RPC_TIMEOUT),
+    )]
@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip('ape')
+from _veyfi import Deposit, correlate
+
+
+def log(name, index, **args):
+    return SimpleNamespace(
+        event_name=name, transaction_hash='0xaa', block_number=10, log_index=index, event_arguments=args,
+    )
+
+
+def modify_lock(index, user):
+    return log('ModifyLock', index, sender=user, user=user, amount=0, locktime=0, ts=0)
+
+
+def supply(index, old, new):
+    return log('Supply', index, old_supply=old, new_supply=new, ts=0)
+
+
+def test_several_users_in_one_transaction():
+    logs = [modify_lock(1, 'alice'), supply(2, 100, 150), modify_lock(3, 'bob'), supply(4, 150, 170)]
+    assert correlate(reversed(logs)) == [
+        Deposit('0xaa', 10, 2, 'alice', 50),
+        Deposit('0xaa', 10, 4, 'bob', 20),
+    ]
+
+
+def test_supply_logged_before_modify_lock():
+    logs = [supply(1, 100, 150), modify_lock(2, 'alice'), supply(3, 150, 170), modify_lock(4, 'bob')]
+    assert [(d.user, d.amount) for d in correlate(logs)] == [('alice', 50), ('bob', 20)]
+
+
+def test_withdrawal_is_skipped_quietly(capsys):
+    assert correlate([supply(1, 150, 100)]) == []
+    assert capsys.readouterr().out == ''
+
+
+def test_lock_extension_without_amount():
+    logs = [modify_lock(1, 'alice'), supply(2, 100, 100), modify_lock(3, 'bob'), supply(4, 100, 130)]
+    assert [(d.user, d.amount) for d in correlate(logs)] == [('bob', 30)]